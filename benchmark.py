@@ -0,0 +1,534 @@
+"""Offline benchmark and load-test harness for merp-main.py.
+
+Drives slash commands and autocomplete callbacks against fake guilds,
+members and interactions, with a stub HTTP layer that records every API
+call and answers 429 when a route bucket is exhausted. Nothing connects
+to Discord.
+
+    python benchmark.py                     # run and compare with bench_baseline.json
+    python benchmark.py --members 100000    # bigger guild
+    python benchmark.py --update-baseline   # store the current numbers as the baseline
+
+The baseline records --members and --iterations; runs with other values
+are reported but not compared. Each scenario also asserts on the command
+results, so a broken handler fails the run instead of looking fast.
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import statistics
+import string
+import sys
+import time
+import tracemalloc
+import types
+from datetime import datetime, timedelta, timezone
+
+import discord
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "bench_baseline.json")
+OUTPUT_FILE = os.path.join(HERE, "bench_output.txt")
+
+
+def load_bot_module():
+    spec = importlib.util.spec_from_file_location("merp_main", os.path.join(HERE, "merp-main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# --- Stub HTTP layer ---
+class StubHTTP:
+    """Records API calls and simulates Discord's per-route buckets.
+
+    Like discord.py, an exhausted bucket normally makes the call wait for the
+    reset. With surface_429 set the call raises a 429 instead, which exercises
+    the bot's own retry handling.
+    """
+
+    def __init__(self, bucket_size=5, bucket_window=0.05, latency=0.002):
+        self.bucket_size = bucket_size
+        self.bucket_window = bucket_window
+        self.latency = latency
+        self.surface_429 = False
+        self.calls = []  # (route, time)
+        self.rate_limited = 0
+        self.buckets = {}  # route -> (window start, calls in window)
+
+    async def request(self, route: str):
+        await asyncio.sleep(self.latency)
+        while True:
+            now = time.monotonic()
+            start, used = self.buckets.get(route, (now, 0))
+            if now - start >= self.bucket_window:
+                start, used = now, 0
+            if used < self.bucket_size:
+                break
+            self.rate_limited += 1
+            retry_after = start + self.bucket_window - now
+            if self.surface_429:
+                response = types.SimpleNamespace(status=429, reason="Too Many Requests", headers={"Retry-After": f"{retry_after:.3f}"})
+                raise discord.HTTPException(response, "You are being rate limited.")
+            await asyncio.sleep(retry_after)
+        self.buckets[route] = (start, used + 1)
+        self.calls.append((route, now))
+
+    async def send_message(self, channel_id, *, params):
+        # Stands in for discord.py's HTTPClient.send_message, which the announcement fan-out calls directly
+        await self.request(f"POST /channels/{channel_id}/messages")
+        return {"id": len(self.calls), "channel_id": channel_id, **params.payload}
+
+
+# --- Fake Discord objects ---
+class FakeRole:
+    def __init__(self, role_id, name="role", default=False, position=None):
+        self.id = role_id
+        self.name = name
+        self.default = default
+        self.position = position if position is not None else 0 if default else 1
+        self.members = []
+
+    def is_default(self):
+        return self.default
+
+    def __lt__(self, other):
+        return self.position < other.position
+
+    def __ge__(self, other):
+        return self.position >= other.position
+
+
+class FakePermissions:
+    kick_members = ban_members = moderate_members = True
+
+
+class FakeMember:
+    def __init__(self, guild, member_id, name, global_name=None, bot=False, roles=(), joined_at=None, created_at=None, avatar=None):
+        self.guild = guild
+        self.id = member_id
+        self.name = name
+        self.global_name = global_name
+        self.display_name = global_name or name
+        self.bot = bot
+        self.roles = [guild.default_role, *roles]
+        self.joined_at = joined_at
+        self.created_at = created_at or joined_at or datetime.now(timezone.utc)
+        self.avatar = avatar
+        self.guild_permissions = FakePermissions()
+        self.mention = f"<@{member_id}>"
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def top_role(self):
+        return max(self.roles)
+
+    async def add_roles(self, *roles, reason=None):
+        await self.guild.http.request(f"PUT /guilds/{self.guild.id}/members/roles")
+        self.roles.extend(roles)
+
+    async def kick(self, reason=None):
+        await self.guild.kick(self, reason=reason)
+
+    async def ban(self, reason=None):
+        await self.guild.ban(self, reason=reason)
+
+    async def timeout(self, until, reason=None):
+        await self.guild.http.request(f"PATCH /guilds/{self.guild.id}/members")
+
+
+class FakeChannel:
+    def __init__(self, http, channel_id=1):
+        self.http = http
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, content=None, embed=None, embeds=None, view=None):
+        await self.http.request(f"POST /channels/{self.id}/messages")
+        self.sent.append((content, embed or embeds))
+        return types.SimpleNamespace(id=len(self.sent), add_reaction=self._noop)
+
+    async def _noop(self, *args, **kwargs):
+        pass
+
+
+class FakeGuild:
+    def __init__(self, http, guild_id=1, member_count=1000, bot_share=0.02):
+        self.http = http
+        self.id = guild_id
+        self.name = "Benchmark Guild"
+        self.chunked = True
+        self.owner_id = 1
+        self.default_role = FakeRole(guild_id, "@everyone", default=True)
+        self.whitelist_role = FakeRole(1, "whitelist")
+        self.raid_role = FakeRole(2, "raid")
+        self._members = {}
+        now = datetime.now(timezone.utc)
+        rng = random.Random(guild_id)
+        for i in range(member_count):
+            member_id = 10 ** 17 + i
+            name = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 12))) + str(i)
+            roles = [self.raid_role] if i % 50 == 0 else []
+            member = FakeMember(
+                self, member_id, name, global_name=name.title() if i % 3 else None,
+                bot=rng.random() < bot_share, roles=roles, joined_at=now - timedelta(minutes=i),
+            )
+            self._members[member_id] = member
+            for role in roles:
+                role.members.append(member)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def get_member(self, member_id):
+        return self._members.get(member_id)
+
+    def get_role(self, role_id):
+        return {1: self.whitelist_role, 2: self.raid_role}.get(role_id)
+
+    async def query_members(self, user_ids=(), cache=False):
+        return [self._members[member_id] for member_id in user_ids if member_id in self._members]
+
+    async def chunk(self, cache=True):
+        return self.members
+
+    async def kick(self, user, reason=None):
+        await self.http.request(f"DELETE /guilds/{self.id}/members")
+
+    async def ban(self, user, reason=None, delete_message_seconds=0):
+        await self.http.request(f"PUT /guilds/{self.id}/bans")
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self.first_response = None
+        self.messages = []
+
+    def is_done(self):
+        return self.first_response is not None
+
+    def _respond(self, *args, **kwargs):
+        if self.first_response is None:
+            self.first_response = time.perf_counter()
+        self.messages.append((args, kwargs))
+
+    async def send_message(self, *args, **kwargs):
+        self._respond(*args, **kwargs)
+
+    async def defer(self, **kwargs):
+        self._respond(**kwargs)
+
+    async def edit_message(self, **kwargs):
+        self._respond(**kwargs)
+
+    async def send_modal(self, modal):
+        self._respond(modal)
+
+    async def autocomplete(self, choices):
+        self._respond(choices)
+
+
+class FakeInteraction:
+    def __init__(self, guild, user, channel, command="unknown"):
+        self.guild = guild
+        self.user = user
+        self.channel = channel
+        self.data = {"name": command}
+        self.type = discord.InteractionType.application_command
+        self.received = time.perf_counter()
+        self.response = FakeResponse(self)
+        self.followup = types.SimpleNamespace(send=self._edit)
+        self.edits = []
+
+    async def _edit(self, *args, **kwargs):
+        self.edits.append((args, kwargs))
+
+    async def edit_original_response(self, **kwargs):
+        self.edits.append(((), kwargs))
+
+
+# --- Harness ---
+class Result:
+    def __init__(self, name, latencies, elapsed, extra=None):
+        self.name = name
+        self.count = len(latencies)
+        self.ops_per_sec = self.count / elapsed if elapsed else 0.0
+        ordered = sorted(latencies)
+        self.p50_ms = ordered[len(ordered) // 2] * 1000 if ordered else 0.0
+        self.p95_ms = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000 if ordered else 0.0
+        self.mean_ms = statistics.fmean(latencies) * 1000 if latencies else 0.0
+        self.extra = extra or {}
+
+    def to_dict(self):
+        return {"ops_per_sec": round(self.ops_per_sec, 2), "p50_ms": round(self.p50_ms, 4), "p95_ms": round(self.p95_ms, 4)}
+
+    def line(self):
+        extra = "".join(f"  {key}={value}" for key, value in self.extra.items())
+        return (f"{self.name:<28} {self.count:>7} ops  {self.ops_per_sec:>12.1f} ops/s  "
+                f"p50 {self.p50_ms:>9.3f} ms  p95 {self.p95_ms:>9.3f} ms{extra}")
+
+
+async def measure(name, operation, iterations, extra=None):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        op_start = time.perf_counter()
+        await operation(i)
+        latencies.append(time.perf_counter() - op_start)
+    return Result(name, latencies, time.perf_counter() - start, extra)
+
+
+async def run_benchmarks(merp, member_count, iterations):
+    http = StubHTTP()
+    guild = FakeGuild(http, member_count=member_count)
+    channel = FakeChannel(http)
+    moderator = FakeMember(guild, 2, "moderator", roles=[FakeRole(merp.config.authorized_role_id, position=10)])
+    merp.bot._connection.user = types.SimpleNamespace(id=3)
+    merp.bot.ws = types.SimpleNamespace(latency=0.05)
+    merp.bot.get_channel = lambda channel_id: channel
+    merp.bot.http = http
+    rng = random.Random(0)
+    members = [member for member in guild.members if not member.bot]
+    results = []
+
+    # The build yields between slices; the longest gap seen by another task is how long the gateway waits
+    gaps = []
+
+    async def watch_loop():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    watcher = asyncio.create_task(watch_loop())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    merp.member_indexes.pop(guild.id, None)
+    await merp.get_member_index(guild)
+    index_build = time.perf_counter() - start
+    watcher.cancel()
+    results.append(Result("index_build", [index_build], index_build, {"members": member_count, "max_loop_stall_ms": round(max(gaps) * 1000, 1)}))
+
+    # Bytes held per cached discord.py Member, which FULL_MEMBER_BYTES estimates for /systeminfo
+    state = discord.Client(intents=discord.Intents.none())._connection
+    sample_guild = discord.Guild(data={"id": str(guild.id), "name": guild.name, "roles": [], "emojis": [], "stickers": []}, state=state)
+    payloads = [
+        {
+            "user": {"id": str(member.id), "username": member.name, "global_name": member.global_name, "discriminator": "0", "avatar": None},
+            "roles": [str(role.id) for role in member.roles if not role.is_default()],
+            "joined_at": member.joined_at.isoformat(), "deaf": False, "mute": False, "flags": 0,
+        }
+        for member in members[:1000]
+    ]
+    tracemalloc.start()
+    start = time.perf_counter()
+    before = tracemalloc.get_traced_memory()[0]
+    for payload in payloads:
+        sample_guild._add_member(discord.Member(data=payload, guild=sample_guild, state=state))
+    member_bytes = (tracemalloc.get_traced_memory()[0] - before) // len(payloads)
+    tracemalloc.stop()
+    elapsed = time.perf_counter() - start
+    results.append(Result("member_cache_bytes", [elapsed], elapsed, {"bytes_per_member": member_bytes, "estimate": merp.FULL_MEMBER_BYTES}))
+
+    queries = [rng.choice(members).name[:rng.randint(1, 4)] for _ in range(iterations)]
+
+    async def autocomplete(i):
+        interaction = FakeInteraction(guild, moderator, channel, "whitelist_approved:autocomplete")
+        choices = await merp.whitelist_approved_autocomplete(interaction, queries[i])
+        # Prefix matches come first; any remaining slots hold substring matches
+        assert choices and choices[0].name.lower().startswith(queries[i]), queries[i]
+        assert all(queries[i] in choice.name.lower() for choice in choices), queries[i]
+    results.append(await measure("autocomplete_prefix", autocomplete, iterations))
+
+    substrings = [rng.choice(members).name[2:5] for _ in range(iterations)]
+
+    async def autocomplete_substring(i):
+        interaction = FakeInteraction(guild, moderator, channel, "whitelist_approved:autocomplete")
+        choices = await merp.whitelist_approved_autocomplete(interaction, substrings[i])
+        assert choices and all(substrings[i] in choice.name.lower() for choice in choices), substrings[i]
+    results.append(await measure("autocomplete_substring", autocomplete_substring, iterations))
+
+    lookups = []
+    for _ in range(iterations):
+        member = rng.choice(members)
+        lookups.append((member, rng.choice([member.name, str(member.id), member.mention])))
+
+    async def resolve(i):
+        expected, text = lookups[i]
+        member, error = await merp.resolve_member(guild, text)
+        assert error is None and member.name == expected.name, (text, error)
+    results.append(await measure("resolve_member", resolve, iterations))
+
+    async def build_embeds(i):
+        merp.whitelist_approved_embed(members[i % len(members)], moderator)
+        merp.whitelist_rejected_embed(members[i % len(members)], moderator)
+    results.append(await measure("whitelist_embeds", build_embeds, iterations))
+
+    async def approve(i):
+        interaction = FakeInteraction(guild, moderator, channel, "whitelist_approved")
+        member = members[i % len(members)]
+        await merp.whitelist_approved.callback(interaction, str(member.id))
+        assert interaction.response.messages[0][0] == ("Approval logged successfully.",), interaction.response.messages
+        assert guild.whitelist_role in member.roles
+    results.append(await measure("whitelist_approved", approve, min(iterations, 2000)))
+
+    async def role_check(i):
+        member = moderator if i % 2 else members[i % len(members)]
+        granted = merp.permissions.granted(guild.id, member)
+        assert ("management" in granted) == any(role.id == merp.config.authorized_role_id for role in member.roles), granted
+    merp.permissions.cache.clear()
+    results.append(await measure("role_check", role_check, iterations))
+
+    async def ping(i):
+        interaction = FakeInteraction(guild, moderator, channel, "ping")
+        await merp.ping.callback(interaction)
+        assert interaction.response.is_done()
+    results.append(await measure("ping", ping, iterations))
+
+    await merp.metrics_sampler.coro()
+
+    async def systeminfo(i):
+        interaction = FakeInteraction(guild, moderator, channel, "systeminfo")
+        await merp.systeminfo.callback(interaction, history=True)
+        assert interaction.response.is_done()
+    results.append(await measure("systeminfo", systeminfo, min(iterations, 1000)))
+
+    calls_before, limited_before = len(http.calls), http.rate_limited
+    http.surface_429 = True
+    targets = " ".join(str(member.id) for member in members[:500])
+
+    async def bulk_kick(i):
+        interaction = FakeInteraction(guild, moderator, channel, "bulk_kick")
+        await merp.bulk_kick.callback(interaction, member_ids=targets, reason="benchmark")
+    result = await measure("bulk_kick_500", bulk_kick, 1)
+    result.extra = {"api_calls": len(http.calls) - calls_before, "429s": http.rate_limited - limited_before}
+    assert result.extra["api_calls"] == 500, result.extra
+    http.surface_429 = False
+    results.append(result)
+
+    # A 1000-member join flood of fresh accounts with numbered names; half have an avatar
+    now = datetime.now(timezone.utc)
+    raiders = [
+        FakeMember(guild, 10 ** 18 + i, f"raider{i}", created_at=now - timedelta(hours=1), avatar=None if i % 2 else "avatar")
+        for i in range(1000)
+    ]
+    alerts_before = merp.log_sink.queue.qsize() if merp.log_sink.queue else 0
+
+    async def raid_join(i):
+        await merp.detect_join_flood(raiders[i])
+    merp.join_windows.pop(guild.id, None)
+    result = await measure("raid_join_flood", raid_join, len(raiders))
+    window = merp.join_windows[guild.id]
+    result.extra = {"suspicious": window.suspicious, "alerts": (merp.log_sink.queue.qsize() if merp.log_sink.queue else 0) - alerts_before}
+    assert window.suspicious > 0 and result.extra["alerts"] == 1, result.extra
+    window.watch_task.cancel()
+    results.append(result)
+
+    calls_before, limited_before = len(http.calls), http.rate_limited
+    http.surface_429 = True
+    fanout_channels = list(range(1000, 1050))
+    embed = discord.Embed(title="Benchmark", description="Fan-out announcement")
+
+    async def fanout(i):
+        delivered = await merp.fan_out(embed, None, fanout_channels)
+        assert all(error is None for _, error in delivered), delivered
+    result = await measure("announce_fanout_50", fanout, 1)
+    result.extra = {"api_calls": len(http.calls) - calls_before, "429s": http.rate_limited - limited_before}
+    assert result.extra["api_calls"] == len(fanout_channels), result.extra
+    http.surface_429 = False
+    results.append(result)
+
+    # Scrape the Prometheus endpoint on an ephemeral loopback port
+    merp.command_metrics.setdefault("ping", merp.CommandMetrics()).record(0.004)
+    merp.command_metrics["ping"].deadline_misses += 1
+    merp.METRICS_HTTP_HOST, merp.METRICS_HTTP_PORT = "127.0.0.1", 0
+    await merp.start_metrics_server()
+    host, port = merp.metrics_server.sockets[0].getsockname()[:2]
+
+    async def scrape(path):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+        await writer.drain()
+        response = (await reader.read()).decode()
+        writer.close()
+        return response
+
+    async def metrics_endpoint(i):
+        response = await scrape("/metrics")
+        assert response.startswith("HTTP/1.1 200 OK"), response.splitlines()[0]
+        assert 'merp_command_latency_seconds_bucket{command="ping",le="0.005"}' in response
+        assert 'merp_command_deadline_misses_total{command="ping"} 1' in response
+        assert "merp_event_loop_lag_seconds" in response
+    results.append(await measure("metrics_endpoint", metrics_endpoint, min(iterations, 200)))
+    response = await scrape("/other")
+    assert response.startswith("HTTP/1.1 404"), response.splitlines()[0]
+    merp.metrics_server.close()
+
+    # Let the batched log sink drain so its sends are counted too
+    await asyncio.sleep(merp.LOG_FLUSH_WINDOW + 0.5)
+    return results, http
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for result in results:
+        expected = baseline["results"].get(result.name)
+        if not expected:
+            continue
+        if result.ops_per_sec < expected["ops_per_sec"] * (1 - tolerance):
+            regressions.append(f"{result.name}: {result.ops_per_sec:.1f} ops/s vs baseline {expected['ops_per_sec']:.1f}")
+        if result.p95_ms > expected["p95_ms"] * (1 + tolerance) and result.p95_ms - expected["p95_ms"] > 0.05:
+            regressions.append(f"{result.name}: p95 {result.p95_ms:.3f} ms vs baseline {expected['p95_ms']:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100_000, help="members in the fake guild")
+    parser.add_argument("--iterations", type=int, default=5000, help="operations per scenario")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a scenario counts as a regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results to bench_baseline.json")
+    args = parser.parse_args()
+
+    merp = load_bot_module()
+    results, http = asyncio.run(run_benchmarks(merp, args.members, args.iterations))
+
+    lines = [f"merp-main benchmark, {args.members} members, {args.iterations} iterations", ""]
+    lines += [result.line() for result in results]
+    lines += ["", f"stub HTTP: {len(http.calls)} calls, {http.rate_limited} rate limited"]
+
+    status = 0
+    if args.update_baseline:
+        baseline = {"members": args.members, "iterations": args.iterations, "results": {result.name: result.to_dict() for result in results}}
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2)
+        lines.append(f"Baseline written to {os.path.basename(BASELINE_FILE)}.")
+    elif os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if (baseline.get("members"), baseline.get("iterations")) != (args.members, args.iterations):
+            # Throughput depends on guild size and run length, so other settings are not comparable
+            lines.append(f"Baseline was taken with --members {baseline.get('members')} --iterations {baseline.get('iterations')}; comparison skipped.")
+        else:
+            regressions = compare(results, baseline, args.tolerance)
+            lines += ["Regressions:", *(f"  {regression}" for regression in regressions)] if regressions else ["No regressions against baseline."]
+            status = 1 if regressions else 0
+
+    report = "\n".join(lines)
+    print(report)
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        f.write(report + "\n")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
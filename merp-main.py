@@ -1,34 +1,605 @@
+import time
+startup_started = time.perf_counter()
+import aiohttp
 import discord
 from discord.ext import commands
 from discord import app_commands
 from discord.ext import commands, tasks
 import asyncio
+import bisect
+import csv
+import functools
+import gc
+import hashlib
+import heapq
+import importlib
+import io
+import json
+import math
+import queue
+import re
+import signal
+import subprocess
+import sys
+import sqlite3
+import threading
+import uuid
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from contextlib import closing
 from datetime import datetime, timedelta
 import pytz
 import os
-import psutil
-import platform
 from discord.ui import Modal, TextInput, View
 from discord.ui import Select, View
-        
+
+
+# --- Startup profile ---
+class StartupProfile:
+    """Time spent in each startup phase, printed once the bot is serving commands."""
+
+    def __init__(self, started: float):
+        self.last = started
+        self.phases = []
+        self.reported = False
+
+    def mark(self, phase: str):
+        if self.reported:
+            return  # reconnects fire the same events again
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        self.reported = True
+        total = sum(seconds for _, seconds in self.phases)
+        print(f"[INFO] Startup took {total:.2f}s:")
+        for phase, seconds in self.phases:
+            print(f"[INFO]   {phase:<28} {seconds * 1000:9.1f} ms")
+
+
+startup_profile = StartupProfile(startup_started)
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            if config.profile_startup:
+                print(f"[INFO] Imported {self._name} on first use in {(time.perf_counter() - started) * 1000:.1f} ms.")
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)  # later lookups skip __getattr__
+        return value
+
+
+psutil = LazyModule("psutil")  # only the metrics sampler and /systeminfo need it
+startup_profile.mark("imports")
+
+
+# --- Async helpers ---
+async def wait_or_timeout(awaitable, timeout):
+    """Await with a timeout and return None when it expires.
+
+    asyncio.wait_for on Python 3.11 and older can swallow a cancellation that
+    races with completion, which leaves background loops running at shutdown.
+    """
+    future = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait({future}, timeout=timeout)
+    finally:
+        if not future.done():
+            future.cancel()
+    return future.result() if done else None
+
+
+# --- Cron expressions ---
+class CronSpec:
+    """Five-field cron expression (minute hour day-of-month month day-of-week)."""
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError("Cron expressions need 5 fields: minute hour day month weekday.")
+        parsed = [self._parse_field(field, low, high) for field, (low, high) in zip(fields, self.RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {day % 7 for day in weekdays}  # 0 and 7 are both Sunday
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+        self.expression = expression
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int):
+        values = set()
+        for part in field.split(","):
+            span, _, step = part.partition("/")
+            if span == "*":
+                start, end = low, high
+            elif "-" in span:
+                start, end = (int(x) for x in span.split("-", 1))
+            else:
+                start = end = int(span)
+            if start < low or end > high or start > end:
+                raise ValueError(f"`{part}` is outside {low}-{high}.")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return sorted(values)
+
+    def _day_matches(self, day):
+        day_ok = day.day in self.days
+        weekday_ok = (day.weekday() + 1) % 7 in self.weekdays
+        # Standard cron: when both fields are restricted either one may match
+        if self.any_day:
+            return weekday_ok
+        if self.any_weekday:
+            return day_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, after: datetime, tz):
+        local = after.astimezone(tz)
+        day = local.date()
+        for _ in range(366 * 5):
+            if day.month in self.months and self._day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = tz.localize(datetime(day.year, day.month, day.day, hour, minute))
+                        if candidate > after:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError("Cron expression never fires.")
+
+
+# --- Configuration ---
+# Settings are read from CONFIG_FILE (a JSON object) and MERP_<NAME> environment variables,
+# which win over the file, e.g. MERP_TOKEN or MERP_LOGGING_CHANNEL_ID. /config_reload or SIGHUP
+# applies changes to reloadable settings; the others only take effect after a restart.
+CONFIG_FILE = os.environ.get("MERP_CONFIG", "config.json")
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def parse_str(value):
+    if not isinstance(value, str):
+        raise ValueError("expected a string")
+    return value
+
+
+def parse_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("expected an integer")
+    return int(value)
+
+
+def parse_positive_int(value):
+    value = parse_int(value)
+    if value <= 0:
+        raise ValueError("expected a positive integer")
+    return value
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("1", "true", "yes", "on", "0", "false", "no", "off"):
+        return value.lower() in ("1", "true", "yes", "on")
+    raise ValueError("expected true or false")
+
+
+def parse_url(value):
+    value = parse_str(value)
+    if not value.startswith(("https://", "http://")):
+        raise ValueError("expected an http(s) URL")
+    return value
+
+
+def parse_timezone(value):
+    value = parse_str(value)
+    if value not in pytz.all_timezones_set:
+        raise ValueError(f"unknown timezone {value}")
+    return value
+
+
+def parse_scheduled_jobs(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    jobs = []
+    for entry in value:
+        if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+            raise ValueError("expected [cron expression, message] pairs")
+        try:
+            CronSpec(parse_str(entry[0]))
+        except ValueError as e:
+            raise ValueError(f"invalid cron expression {entry[0]!r}: {e}")
+        jobs.append((entry[0], parse_str(entry[1])))
+    return tuple(jobs)
+
+
+def parse_channel_groups(value):
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        raise ValueError("expected group names mapped to lists of channel ids")
+    return {str(name): tuple(parse_positive_int(channel_id) for channel_id in channel_ids) for name, channel_ids in value.items()}
+
+
+def parse_choice(*choices):
+    def parse(value):
+        if value not in choices:
+            raise ValueError(f"expected one of {', '.join(choices)}")
+        return value
+    return parse
+
+
+def optional(parse):
+    def parse_optional(value):
+        return None if value is None or value == "" else parse(value)
+    return parse_optional
+
+
+ConfigField = namedtuple("ConfigField", "parse default reloadable")
+
+CONFIG_FIELDS = {
+    "token": ConfigField(parse_str, "", False),
+    "authorized_role_id": ConfigField(parse_positive_int, 1, True),  # management role
+    "logging_channel_id": ConfigField(parse_positive_int, 1, True),  # channel for whitelist log embeds
+    "whitelist_role_id": ConfigField(parse_positive_int, 1, True),
+    "approval_image_url": ConfigField(parse_url, "https://merpindia.in/gallery/whitelist_approved.png", True),
+    "rejection_image_url": ConfigField(parse_url, "https://merpindia.in/gallery/whitelist_rejected.png", True),
+    "permissions_file": ConfigField(parse_str, "permissions.json", True),
+    "faq_file": ConfigField(parse_str, "faq.json", True),
+    "sync_guild_id": ConfigField(optional(parse_positive_int), None, True),  # sync commands to one guild while iterating
+    "channel_groups": ConfigField(parse_channel_groups, {}, True),  # announcement fan-out targets, may span guilds
+    "default_timezone": ConfigField(parse_timezone, "Asia/Kolkata", True),
+    # Seed-only: these fill SCHEDULE_FILE when it is first created; afterwards jobs are edited with /schedule_*
+    "scheduled_channel_id": ConfigField(parse_positive_int, 1315896892156018769, False),
+    "default_scheduled_jobs": ConfigField(parse_scheduled_jobs, [["5 8 * * *", "Test Morning 8:05"], ["5 20 * * *", "test msg."]], False),
+    "raid_detection": ConfigField(parse_bool, True, True),
+    "raid_join_threshold": ConfigField(parse_positive_int, 15, True),  # joins within the window that count as a raid
+    "raid_window_seconds": ConfigField(parse_positive_int, 60, True),
+    "raid_account_age_days": ConfigField(parse_positive_int, 7, True),  # younger accounts count as suspicious
+    "raid_timeout_minutes": ConfigField(parse_int, 0, True),  # time out suspicious joiners during a raid; 0 only alerts
+    "lean_member_cache": ConfigField(parse_bool, False, False),
+    "sharded": ConfigField(parse_bool, False, False),
+    "shard_count": ConfigField(optional(parse_positive_int), None, False),
+    "shard_processes": ConfigField(parse_positive_int, 1, False),
+    "metrics_http_host": ConfigField(parse_str, "127.0.0.1", False),
+    "metrics_http_port": ConfigField(optional(parse_int), 9108, False),
+    "member_chunking": ConfigField(parse_choice("startup", "background", "lazy"), "startup", False),
+    "profile_startup": ConfigField(parse_bool, False, False),  # print how long each startup phase took
+}
+
+
+class Config:
+    """Validated settings. Reloads build a new Config and replace the old one in a single assignment."""
+
+    def __init__(self, values: dict):
+        self.__dict__.update(values)
+
+    @classmethod
+    def load(cls, path: str = CONFIG_FILE, environ=os.environ):
+        data = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                raise ConfigError(f"{path}: {e}") from e
+            if not isinstance(data, dict):
+                raise ConfigError(f"{path} must hold a JSON object")
+        errors = [f"{name}: unknown setting" for name in data if name not in CONFIG_FIELDS]
+        values = {}
+        for name, field in CONFIG_FIELDS.items():
+            env_name = f"MERP_{name.upper()}"
+            source, value = (env_name, environ[env_name]) if env_name in environ else (name, data.get(name, field.default))
+            try:
+                values[name] = field.parse(value)
+            except (TypeError, ValueError) as e:
+                errors.append(f"{source}: {e}")
+        if errors:
+            raise ConfigError("; ".join(errors))
+        return cls(values)
+
+    def changes(self, other: "Config"):
+        return [name for name in CONFIG_FIELDS if getattr(self, name) != getattr(other, name)]
+
+
+try:
+    config = Config.load()
+except ConfigError as e:
+    raise SystemExit(f"[ERROR] Invalid configuration: {e}")
+startup_profile.mark("config")
+
+
+# --- Command instrumentation ---
+INTERACTION_DEADLINE = 3.0  # seconds Discord waits for the first response
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 3.0, 5.0, 10.0)
+LATENCY_RESERVOIR = 1000  # recent samples kept per command for percentiles
+RESPONSE_POLL_INTERVAL = 0.005  # seconds between checks for the first response while a handler runs
+
+
+class CommandMetrics:
+    """Latency histogram, recent samples and error counters for one command or autocomplete callback."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.recent = deque(maxlen=LATENCY_RESERVOIR)
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.deadline_misses = 0
+
+    def record(self, seconds: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, fraction: float):
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+command_metrics = {}  # command name -> CommandMetrics
+
+
+def interaction_metric_name(interaction: discord.Interaction):
+    name = (interaction.data or {}).get("name", "unknown")
+    if interaction.type is discord.InteractionType.autocomplete:
+        return f"{name}:autocomplete"
+    return name
+
+
+def check_interaction_deadline(interaction: discord.Interaction, name: str):
+    """Count a deadline miss if the interaction is still unanswered. Returns True when it was counted."""
+    if interaction.response.is_done():
+        return False
+    command_metrics.setdefault(name, CommandMetrics()).deadline_misses += 1
+    print(f"[WARN] /{name} did not respond within {INTERACTION_DEADLINE:.0f}s.")
+    return True
+
+
+def interaction_age(interaction: discord.Interaction) -> float:
+    """Seconds since Discord created the interaction, which is when its response deadline started."""
+    return (discord.utils.utcnow() - interaction.created_at).total_seconds()
+
+
+class InstrumentedTree(app_commands.CommandTree):
+    """Command tree that times every slash command and autocomplete callback until its first response."""
+
+    async def _call(self, interaction: discord.Interaction):
+        name = interaction_metric_name(interaction)
+        answered = missed = False
+
+        def record_response():
+            nonlocal answered
+            answered = True
+            command_metrics.setdefault(name, CommandMetrics()).record(interaction_age(interaction))
+
+        async def probe():
+            # Handlers often keep working after they respond, so the first response is watched for instead of the return
+            nonlocal missed
+            while not interaction.response.is_done():
+                if not missed and interaction_age(interaction) >= INTERACTION_DEADLINE:
+                    missed = check_interaction_deadline(interaction, name)
+                await asyncio.sleep(RESPONSE_POLL_INTERVAL)
+            record_response()
+
+        watcher = asyncio.create_task(probe())
+        try:
+            await super()._call(interaction)
+        finally:
+            watcher.cancel()
+            if answered or missed:
+                pass
+            elif interaction.response.is_done():
+                # Answered since the probe last looked
+                record_response()
+            else:
+                # Never answered; the probe has not counted it yet when the handler returned early
+                check_interaction_deadline(interaction, name)
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        if not isinstance(error, app_commands.CheckFailure):
+            command_metrics.setdefault(interaction_metric_name(interaction), CommandMetrics()).errors += 1
+        await super().on_error(interaction, error)
+
 
 intents = discord.Intents.default()
 intents.members = True  
-bot = commands.Bot(command_prefix="!", intents=intents)
 
+# Lean mode keeps compact member records instead of discord.py's full Member cache
+LEAN_MEMBER_CACHE = config.lean_member_cache
+member_cache_options = {}
+if LEAN_MEMBER_CACHE:
+    member_cache_options = {"member_cache_flags": discord.MemberCacheFlags.none(), "chunk_guilds_at_startup": False}
+elif config.member_chunking != "startup":
+    # Guilds are chunked in the background or on first need instead of before on_ready
+    member_cache_options = {"chunk_guilds_at_startup": False}
+
+# --- Sharding ---
+SHARDED = config.sharded  # opt in to AutoShardedBot
+SHARD_COUNT = config.shard_count  # total shards; None lets Discord recommend a count (single process only)
+SHARD_PROCESSES = config.shard_processes  # OS processes the shards are split across, each with its own member cache
+SHARD_STATS_DIR = "shard_stats"
+SHARD_STATS_STALE = 30  # seconds before a process' stats are reported as stale
+
+# Set by the launcher for each shard worker process
+PROCESS_INDEX = int(os.environ.get("MERP_PROCESS_INDEX", "0"))
+PROCESS_SHARD_IDS = [int(i) for i in os.environ["MERP_SHARD_IDS"].split(",")] if os.environ.get("MERP_SHARD_IDS") else None
+# Cross-shard jobs (scheduler, command sync, audit pruning) only run in the process that owns shard 0
+IS_PRIMARY_PROCESS = PROCESS_SHARD_IDS is None or 0 in PROCESS_SHARD_IDS
+
+if SHARDED:
+    bot = commands.AutoShardedBot(
+        command_prefix="!", intents=intents, tree_cls=InstrumentedTree,
+        shard_count=SHARD_COUNT, shard_ids=PROCESS_SHARD_IDS, **member_cache_options,
+    )
+else:
+    bot = commands.Bot(command_prefix="!", intents=intents, tree_cls=InstrumentedTree, **member_cache_options)
+
+
+def shard_process_ranges():
+    shard_ids = list(range(SHARD_COUNT))
+    size = math.ceil(len(shard_ids) / SHARD_PROCESSES)
+    return [shard_ids[i:i + size] for i in range(0, len(shard_ids), size)]
+
+
+def run_shard_processes():
+    """Launch one worker process per shard range and restart any that exit with an error."""
+    if not SHARD_COUNT:
+        raise SystemExit("SHARD_COUNT must be set to split shards across processes.")
+    os.makedirs(SHARD_STATS_DIR, exist_ok=True)
+
+    def spawn(index, shard_ids):
+        env = dict(os.environ, MERP_PROCESS_INDEX=str(index), MERP_SHARD_IDS=",".join(map(str, shard_ids)))
+        print(f"[INFO] Starting shard process {index} for shards {shard_ids}.")
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env)
+
+    ranges = shard_process_ranges()
+    processes = {index: spawn(index, shard_ids) for index, shard_ids in enumerate(ranges)}
 
-AUTHORIZED_ROLE_ID = 1   #management role id
-LOGGING_CHANNEL_ID = 1  #logging channel to send user whitelisted embed
-WHITELIST_ROLE_ID = 1  # Replace with the ID of the whitelist role
-APPROVAL_IMAGE_URL = "https://merpindia.in/gallery/whitelist_approved.png"  
-REJECTION_IMAGE_URL = "https://merpindia.in/gallery/whitelist_rejected.png"
+    def forward_reload(signum, frame):
+        for process in processes.values():
+            process.send_signal(signal.SIGHUP)
 
-def has_required_role(interaction: discord.Interaction):
-    return any(role.id == AUTHORIZED_ROLE_ID for role in interaction.user.roles)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, forward_reload)
+    try:
+        while processes:
+            time.sleep(1)
+            for index, process in list(processes.items()):
+                code = process.poll()
+                if code is None:
+                    continue
+                if code == 0:
+                    del processes[index]
+                else:
+                    print(f"[ERROR] Shard process {index} exited with code {code}, restarting.")
+                    time.sleep(5)
+                    processes[index] = spawn(index, ranges[index])
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.terminate()
+
+
+def write_shard_stats(sample):
+    shards = {str(shard_id): latency for shard_id, latency in bot.latencies if math.isfinite(latency)}
+    stats = {
+        "process": PROCESS_INDEX,
+        "time": sample.time,
+        "guilds": len(bot.guilds),
+        "shards": shards,
+        "cpu": sample.process_cpu,
+        "rss": sample.rss,
+        "loop_lag": sample.loop_lag,
+        "tasks": sample.tasks,
+    }
+    os.makedirs(SHARD_STATS_DIR, exist_ok=True)
+    path = os.path.join(SHARD_STATS_DIR, f"process-{PROCESS_INDEX}.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def read_shard_stats():
+    stats = []
+    for name in sorted(os.listdir(SHARD_STATS_DIR)) if os.path.isdir(SHARD_STATS_DIR) else []:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(SHARD_STATS_DIR, name), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        data["stale"] = time.time() - data["time"] > SHARD_STATS_STALE
+        stats.append(data)
+    return stats
+
+
+# --- Permissions ---
+# The permissions file maps permission names to authorized role ids, with optional per-guild overrides:
+#   {"default": {"management": [123]}, "guilds": {"456": {"moderation": [789], "whitelist": [790]}}}
+# Management roles are authorized for every permission.
+PERMISSION_NAMES = ("management", "moderation", "whitelist")
+PERMISSION_CACHE_SIZE = 10_000  # role combinations whose granted permissions are remembered
+
+
+class PermissionTable:
+    """Authorized role sets per guild, with a cache of the permissions each combination of roles grants."""
+
+    def __init__(self, data: dict):
+        if not isinstance(data, dict) or not isinstance(data.get("guilds", {}), dict):
+            raise ValueError("expected an object with \"default\" and \"guilds\"")
+        self.default = self.build(data.get("default", {}), {})
+        self.guilds = {
+            int(guild_id): self.build(overrides, data.get("default", {}))
+            for guild_id, overrides in data.get("guilds", {}).items()
+        }
+        self.cache = OrderedDict()  # (guild id, role ids) -> frozenset of permission names
+
+    @staticmethod
+    def build(overrides: dict, default: dict) -> dict:
+        if not isinstance(overrides, dict):
+            raise ValueError("expected permission names mapped to lists of role ids")
+        unknown = set(overrides) - set(PERMISSION_NAMES)
+        if unknown:
+            raise ValueError(f"unknown permissions: {', '.join(sorted(unknown))}")
+        roles = {name: frozenset(int(role_id) for role_id in overrides.get(name, default.get(name, ()))) for name in PERMISSION_NAMES}
+        return {name: role_ids | roles["management"] for name, role_ids in roles.items()}
+
+    def granted(self, guild_id: int, member: discord.Member) -> frozenset:
+        # Keyed on the roles the member holds right now (the interaction payload carries them),
+        # so a role change takes effect on the next command without any invalidation
+        key = (guild_id, tuple(role.id for role in member.roles))
+        granted = self.cache.get(key)
+        if granted is not None:
+            self.cache.move_to_end(key)
+            return granted
+        table = self.guilds.get(guild_id, self.default)
+        granted = frozenset(name for name, authorized in table.items() if not authorized.isdisjoint(key[1]))
+        self.cache[key] = granted
+        if len(self.cache) > PERMISSION_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return granted
+
+
+def build_permissions(settings: Config) -> PermissionTable:
+    """Table from the permissions file; without the file only the authorized role is authorized."""
+    if not os.path.exists(settings.permissions_file):
+        return PermissionTable({"default": {"management": [settings.authorized_role_id]}})
+    with open(settings.permissions_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    try:
+        return PermissionTable(data)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"{settings.permissions_file}: {e}") from e
+
+
+permissions = PermissionTable({"default": {"management": [config.authorized_role_id]}})
+
+
+def has_required_role(interaction: discord.Interaction, permission: str = "management"):
+    if interaction.guild_id is None or not isinstance(interaction.user, discord.Member):
+        return False
+    return permission in permissions.granted(interaction.guild_id, interaction.user)
+
+def role_required(permission: str = "management"):
+    if permission not in PERMISSION_NAMES:
+        raise ValueError(f"unknown permission: {permission}")
 
-def role_required():
     async def predicate(interaction: discord.Interaction):
-        if not has_required_role(interaction):
+        if not has_required_role(interaction, permission):
             await interaction.response.send_message(
                 "You are not authorized to use this bot.",
                 ephemeral=True  
@@ -37,13 +608,247 @@ def role_required():
         return True
     return app_commands.check(predicate)
 
+# --- Moderation audit store ---
+AUDIT_DB_FILE = "moderation_audit.sqlite3"
+AUDIT_RETENTION_DAYS = 365
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_WINDOW = 0.5  # seconds the writer waits to fill a batch
+AUDIT_PAGE_SIZE = 10
+AUDIT_COLUMNS = ("id", "created_at", "guild_id", "action", "target_id", "target_name", "moderator_id", "moderator_name", "reason")
+
+
+class AuditStore:
+    """SQLite moderation log. A single writer thread batches inserts; reads run in worker threads."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.queue = queue.Queue()
+        self.writer = None
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def start(self):
+        if self.writer and self.writer.is_alive():
+            return
+        with self.connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS audit_log (
+                    id INTEGER PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    action TEXT NOT NULL,
+                    target_id INTEGER,
+                    target_name TEXT,
+                    moderator_id INTEGER,
+                    moderator_name TEXT,
+                    reason TEXT
+                );
+                CREATE INDEX IF NOT EXISTS audit_target ON audit_log (guild_id, target_id, id);
+                CREATE INDEX IF NOT EXISTS audit_moderator ON audit_log (guild_id, moderator_id, id);
+                CREATE INDEX IF NOT EXISTS audit_action ON audit_log (guild_id, action, id);
+                CREATE INDEX IF NOT EXISTS audit_created ON audit_log (created_at);
+            """)
+        self.writer = threading.Thread(target=self.write_loop, name="audit-writer", daemon=True)
+        self.writer.start()
+
+    def record(self, guild_id: int, action: str, target, moderator, reason: str = None):
+        self.queue.put((
+            time.time(), guild_id, action,
+            getattr(target, "id", target), str(target) if hasattr(target, "id") else None,
+            getattr(moderator, "id", moderator), str(moderator) if hasattr(moderator, "id") else None,
+            reason,
+        ))
+
+    def close(self, timeout: float = 10.0):
+        """Write out everything recorded so far and stop the writer thread."""
+        if self.writer is None or not self.writer.is_alive():
+            return
+        self.queue.put(None)
+        self.writer.join(timeout)
+        if self.writer.is_alive():
+            print(f"[WARN] Audit writer did not finish within {timeout:.0f}s; {self.queue.qsize()} entries may be lost.")
+
+    def write_loop(self):
+        connection = self.connect()
+        stopping = False
+        while not stopping:
+            # None is the stop marker from close(), queued behind every pending entry
+            entry = self.queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + AUDIT_FLUSH_WINDOW
+            while len(batch) < AUDIT_BATCH_SIZE:
+                try:
+                    entry = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            try:
+                with connection:
+                    connection.executemany(
+                        "INSERT INTO audit_log (created_at, guild_id, action, target_id, target_name, moderator_id, moderator_name, reason)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        batch,
+                    )
+            except sqlite3.Error as e:
+                print(f"[ERROR] Could not write {len(batch)} audit entries: {e}")
+        connection.close()
+
+    def _where(self, guild_id, target_id=None, moderator_id=None, action=None):
+        clauses, params = ["guild_id = ?"], [guild_id]
+        for column, value in (("target_id", target_id), ("moderator_id", moderator_id), ("action", action)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return " AND ".join(clauses), params
+
+    def _query(self, guild_id, target_id, moderator_id, action, before_id, limit):
+        where, params = self._where(guild_id, target_id, moderator_id, action)
+        if before_id is not None:
+            where += " AND id < ?"
+            params.append(before_id)
+        with closing(self.connect()) as connection:
+            return connection.execute(
+                f"SELECT {', '.join(AUDIT_COLUMNS)} FROM audit_log WHERE {where} ORDER BY id DESC LIMIT ?",
+                params + [limit],
+            ).fetchall()
+
+    async def query(self, guild_id, target_id=None, moderator_id=None, action=None, before_id=None, limit=AUDIT_PAGE_SIZE):
+        return await asyncio.to_thread(self._query, guild_id, target_id, moderator_id, action, before_id, limit)
+
+    def _prune(self, days):
+        with closing(self.connect()) as connection, connection:
+            return connection.execute("DELETE FROM audit_log WHERE created_at < ?", (time.time() - days * 86400,)).rowcount
+
+    async def prune(self, days: int = AUDIT_RETENTION_DAYS):
+        return await asyncio.to_thread(self._prune, days)
+
+    def _export(self, fmt, guild_id, target_id, moderator_id, action):
+        where, params = self._where(guild_id, target_id, moderator_id, action)
+        output = io.StringIO()
+        writer = csv.writer(output) if fmt == "csv" else None
+        if writer:
+            writer.writerow(AUDIT_COLUMNS)
+        with closing(self.connect()) as connection:
+            for row in connection.execute(f"SELECT {', '.join(AUDIT_COLUMNS)} FROM audit_log WHERE {where} ORDER BY id", params):
+                if writer:
+                    writer.writerow(row)
+                else:
+                    output.write(json.dumps(dict(zip(AUDIT_COLUMNS, row))) + "\n")
+        return output.getvalue().encode()
+
+    async def export(self, fmt, guild_id, target_id=None, moderator_id=None, action=None):
+        return await asyncio.to_thread(self._export, fmt, guild_id, target_id, moderator_id, action)
+
+
+audit_store = AuditStore(AUDIT_DB_FILE)
+
+
+@tasks.loop(hours=24)
+async def audit_retention():
+    removed = await audit_store.prune()
+    if removed:
+        print(f"[INFO] Pruned {removed} audit entries older than {AUDIT_RETENTION_DAYS} days.")
+
+
+AUDIT_ACTION_CHOICES = [
+    app_commands.Choice(name=name, value=name)
+    for name in (
+        "kick", "ban", "timeout", "tempban", "temprole", "unban", "role_expired", "timeout_expired",
+        "whitelist_approved", "whitelist_rejected",
+    )
+]
+
+
+def modlog_embed(rows, page: int):
+    embed = discord.Embed(title="Moderation Log", color=0x3498db)
+    lines = []
+    for entry_id, created_at, _, action, target_id, target_name, moderator_id, _, reason in rows:
+        line = f"`#{entry_id}` <t:{int(created_at)}:f> **{action}** <@{target_id}> by <@{moderator_id}>"
+        if reason:
+            line += f" — {reason[:100]}"
+        lines.append(line)
+    embed.description = "\n".join(lines) or "No matching entries."
+    embed.set_footer(text=f"Page {page + 1}")
+    return embed
+
+
+class ModlogView(View):
+    def __init__(self, filters: dict):
+        super().__init__(timeout=300)
+        self.filters = filters
+        self.cursors = [None]  # before_id for each page that has been visited
+        self.page = 0
+
+    async def show(self, page: int):
+        rows = await audit_store.query(**self.filters, before_id=self.cursors[page], limit=AUDIT_PAGE_SIZE + 1)
+        has_more = len(rows) > AUDIT_PAGE_SIZE
+        rows = rows[:AUDIT_PAGE_SIZE]
+        if has_more and len(self.cursors) == page + 1:
+            self.cursors.append(rows[-1][0])
+        self.page = page
+        self.newer.disabled = page == 0
+        self.older.disabled = not has_more
+        return modlog_embed(rows, page)
+
+    @discord.ui.button(label="◀ Newer", style=discord.ButtonStyle.secondary)
+    async def newer(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(embed=await self.show(self.page - 1), view=self)
+
+    @discord.ui.button(label="Older ▶", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.edit_message(embed=await self.show(self.page + 1), view=self)
+
+
+def modlog_filters(interaction: discord.Interaction, user, moderator, action):
+    return {
+        "guild_id": interaction.guild.id,
+        "target_id": user.id if user else None,
+        "moderator_id": moderator.id if moderator else None,
+        "action": action.value if action else None,
+    }
+
+
+# Slash command: Moderation Log
+@bot.tree.command(name="modlog", description="Browse the moderation history.")
+@role_required("moderation")
+@app_commands.describe(user="Only actions against this user", moderator="Only actions by this moderator", action="Only this type of action")
+@app_commands.choices(action=AUDIT_ACTION_CHOICES)
+async def modlog(interaction: discord.Interaction, user: discord.User = None, moderator: discord.User = None, action: app_commands.Choice[str] = None):
+    view = ModlogView(modlog_filters(interaction, user, moderator, action))
+    embed = await view.show(0)
+    await interaction.response.send_message(embed=embed, view=view, ephemeral=True)
+
+
+# Slash command: Export Moderation Log
+@bot.tree.command(name="modlog_export", description="Export the moderation history as a file.")
+@role_required("moderation")
+@app_commands.describe(format="File format", user="Only actions against this user", moderator="Only actions by this moderator", action="Only this type of action")
+@app_commands.choices(format=[app_commands.Choice(name="CSV", value="csv"), app_commands.Choice(name="JSON Lines", value="jsonl")], action=AUDIT_ACTION_CHOICES)
+async def modlog_export(interaction: discord.Interaction, format: app_commands.Choice[str], user: discord.User = None, moderator: discord.User = None, action: app_commands.Choice[str] = None):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    data = await audit_store.export(format.value, **modlog_filters(interaction, user, moderator, action))
+    await interaction.followup.send(
+        file=discord.File(io.BytesIO(data), filename=f"modlog.{format.value}"),
+        ephemeral=True
+    )
+
+
 # Slash command: Kick
 @bot.tree.command(name="kick", description="Kick a user from the server.")
-@role_required()
+@role_required("moderation")
 @app_commands.describe(member="The member to kick", reason="Reason for the kick")
 async def kick(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
     if interaction.user.guild_permissions.kick_members:
         await member.kick(reason=reason)
+        audit_store.record(interaction.guild.id, "kick", member, interaction.user, reason)
         embed = discord.Embed(
             title="Member Kicked",
             description=f"{member.mention} has been kicked.",
@@ -55,261 +860,2369 @@ async def kick(interaction: discord.Interaction, member: discord.Member, reason:
     else:
         await interaction.response.send_message("You don't have permission to kick members.", ephemeral=True)
 
-# Slash command: Ban
-@bot.tree.command(name="ban", description="Ban a user from the server.")
-@role_required()
-@app_commands.describe(member="The member to ban", reason="Reason for the ban")
-async def ban(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
-    if interaction.user.guild_permissions.ban_members:
-        await member.ban(reason=reason)
-        embed = discord.Embed(
-            title="Member Banned",
-            description=f"{member.mention} has been banned.",
-            color=0x0000ff
-        )
-        embed.add_field(name="Reason", value=reason, inline=False)
-        embed.set_footer(text=f"Actioned by {interaction.user}")
-        await interaction.response.send_message(embed=embed)
-    else:
-        await interaction.response.send_message("You don't have permission to ban members.", ephemeral=True)
+# Slash command: Ban
+@bot.tree.command(name="ban", description="Ban a user from the server.")
+@role_required("moderation")
+@app_commands.describe(member="The member to ban", reason="Reason for the ban")
+async def ban(interaction: discord.Interaction, member: discord.Member, reason: str = "No reason provided"):
+    if interaction.user.guild_permissions.ban_members:
+        await member.ban(reason=reason)
+        audit_store.record(interaction.guild.id, "ban", member, interaction.user, reason)
+        embed = discord.Embed(
+            title="Member Banned",
+            description=f"{member.mention} has been banned.",
+            color=0x0000ff
+        )
+        embed.add_field(name="Reason", value=reason, inline=False)
+        embed.set_footer(text=f"Actioned by {interaction.user}")
+        await interaction.response.send_message(embed=embed)
+    else:
+        await interaction.response.send_message("You don't have permission to ban members.", ephemeral=True)
+
+# Slash command: Timeout
+@bot.tree.command(name="timeout", description="Put a member in timeout.")
+@role_required("moderation")
+@app_commands.describe(member="The member to timeout", duration="Timeout duration in seconds")
+async def timeout(interaction: discord.Interaction, member: discord.Member, duration: int):
+    if interaction.user.guild_permissions.moderate_members:
+        if not 0 < duration <= MAX_TIMEOUT_SECONDS:
+            await interaction.response.send_message("Timeouts must last between 1 second and 28 days.", ephemeral=True)
+            return
+        await member.edit(timeout_until=discord.utils.utcnow() + timedelta(seconds=duration))
+        audit_store.record(interaction.guild.id, "timeout", member, interaction.user, f"{duration} seconds")
+        await expiry_scheduler.add(interaction.guild.id, "timeout", member.id, time.time() + duration, reason=f"{duration} seconds")
+        embed = discord.Embed(
+            title="Member Timed Out",
+            description=f"{member.mention} is in timeout for {duration} seconds.",
+            color=0xffff00
+        )
+        embed.set_footer(text=f"Actioned by {interaction.user}")
+        await interaction.response.send_message(embed=embed)
+    else:
+        await interaction.response.send_message("You don't have permission to moderate members.", ephemeral=True)
+
+# --- Rate-limited action queue ---
+ACTION_CONCURRENCY = 5
+ACTION_MAX_RETRIES = 3
+NETWORK_ERRORS = (aiohttp.ClientError, OSError, asyncio.TimeoutError)  # failures that say nothing about the request itself
+
+
+class ActionQueue:
+    """Runs API actions on a bounded pool of workers, pausing a rate-limit bucket whenever Discord answers 429."""
+
+    def __init__(self, concurrency: int = ACTION_CONCURRENCY, max_retries: int = ACTION_MAX_RETRIES):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.blocked_until = {}  # bucket -> time.monotonic() the bucket reopens
+
+    async def run(self, jobs, on_progress=None):
+        """Run (bucket, label, action) jobs, where action is a coroutine function. Returns [(label, error or None)]."""
+        queue = asyncio.Queue()
+        for i, job in enumerate(jobs):
+            queue.put_nowait((i, job))
+        results = [None] * len(jobs)
+        done = 0
+
+        async def worker():
+            nonlocal done
+            while not queue.empty():
+                i, (bucket, label, action) = queue.get_nowait()
+                results[i] = (label, await self.attempt(bucket, action))
+                done += 1
+                if on_progress:
+                    await on_progress(done, len(jobs))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(jobs)))))
+        return results
+
+    async def attempt(self, bucket, action):
+        error = None
+        for attempt in range(self.max_retries + 1):
+            wait = self.blocked_until.get(bucket, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                await action()
+                return None
+            except discord.RateLimited as e:
+                error, retry_after = e, e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    return e
+                headers = getattr(e.response, "headers", None) or {}
+                error, retry_after = e, float(headers.get("Retry-After", 2 ** attempt))
+            except NETWORK_ERRORS as e:
+                error, retry_after = e, 2 ** attempt
+            self.blocked_until[bucket] = max(self.blocked_until.get(bucket, 0), time.monotonic() + retry_after)
+        return error
+
+
+# --- Bulk moderation ---
+BULK_MAX_TARGETS = 1000
+BULK_PROGRESS_INTERVAL = 2.0  # seconds between progress edits
+moderation_queue = ActionQueue()
+
+
+async def collect_bulk_targets(interaction: discord.Interaction, member_ids: str, role: discord.Role, joined_within: int):
+    """Return ({member id: Member or None}, problems) for the given IDs, role members and recent joins.
+
+    Members whose top role is not below the moderator's are left out and listed as problems.
+    """
+    guild = interaction.guild
+    problems = []
+    if role and role.is_default():
+        problems.append("@everyone cannot be used as a bulk target; pick a narrower role")
+        role = None
+    chunking = ensure_guild_chunked(guild) if role or joined_within else None
+    if chunking:
+        # Role and join filters need every member, which this guild has not loaded yet
+        await interaction.response.defer(thinking=True)
+        await chunking
+    targets = {}
+    if member_ids:
+        for raw in re.split(r"[\s,]+", member_ids.strip()):
+            match = MEMBER_REFERENCE.fullmatch(raw)
+            if not match:
+                problems.append(f"`{raw}` is not a member ID")
+                continue
+            member_id = int(match.group(1) or match.group(2))
+            targets[member_id] = guild.get_member(member_id)
+    if LEAN_MEMBER_CACHE and (role or joined_within):
+        # Role membership and join times come from the compact records; Members are fetched when needed
+        cutoff = time.time() - joined_within * 60 if joined_within else None
+        for record in (await get_member_index(guild)).records.values():
+            if (role and record.has_role(role.id)) or (cutoff and record.joined_at and record.joined_at >= cutoff):
+                targets.setdefault(record.id, None)
+    else:
+        if role:
+            for member in role.members:
+                targets[member.id] = member
+        if joined_within:
+            cutoff = discord.utils.utcnow() - timedelta(minutes=joined_within)
+            for member in guild.members:
+                if member.joined_at and member.joined_at >= cutoff:
+                    targets[member.id] = member
+    for protected in (interaction.user.id, bot.user.id, guild.owner_id):
+        targets.pop(protected, None)
+    if interaction.user.id != guild.owner_id:
+        # Same rule Discord applies to the bot, applied to the moderator the bot acts for
+        records = (await get_member_index(guild)).records if LEAN_MEMBER_CACHE else {}
+        moderator_top = interaction.user.top_role
+        for member_id, member in list(targets.items()):
+            record = records.get(member_id)
+            top_role = member.top_role if member else record.top_role(guild) if record else None
+            if top_role is not None and top_role >= moderator_top:
+                del targets[member_id]
+                problems.append(f"<@{member_id}>: their top role is not below yours")
+    return targets, problems
+
+
+def bulk_progress_reporter(interaction: discord.Interaction, title: str):
+    last_edit = 0.0
+
+    async def report(done: int, total: int):
+        nonlocal last_edit
+        now = time.monotonic()
+        if done < total and now - last_edit < BULK_PROGRESS_INTERVAL:
+            return
+        last_edit = now
+        try:
+            await interaction.edit_original_response(content=f"{title}: {done}/{total} processed…")
+        except discord.HTTPException:
+            pass
+
+    return report
+
+
+def bulk_summary_embed(title: str, results, problems, reason: str, actor, color):
+    failures = [f"{label}: {error}" for label, error in results if error] + problems
+    succeeded = sum(1 for _, error in results if error is None)
+    embed = discord.Embed(
+        title=title,
+        description=f"{succeeded} succeeded, {len(failures)} failed.",
+        color=color
+    )
+    embed.add_field(name="Reason", value=reason, inline=False)
+    if failures:
+        shown = "\n".join(failures[:10])
+        if len(failures) > 10:
+            shown += f"\n…and {len(failures) - 10} more"
+        embed.add_field(name="Failures", value=shown[:1024], inline=False)
+    embed.set_footer(text=f"Actioned by {actor}")
+    return embed
+
+
+async def run_bulk_action(interaction: discord.Interaction, verb: str, title: str, color, targets, problems, reason, make_action, need_members=False):
+    """Run `make_action` for every target and report the outcome. Returns the targets the action succeeded for."""
+    # collect_bulk_targets may already have deferred while members were loading
+    deferred = interaction.response.is_done()
+    send = interaction.followup.send if deferred else interaction.response.send_message
+    if not targets:
+        await send("\n".join(["No members matched. Provide member IDs, a role or a join window.", *problems[:10]]), ephemeral=True)
+        return []
+    if len(targets) > BULK_MAX_TARGETS:
+        await send(f"Refusing to {verb} {len(targets)} members at once (limit {BULK_MAX_TARGETS}).", ephemeral=True)
+        return []
+    if not deferred:
+        await interaction.response.defer(thinking=True)
+    if need_members:
+        # Look up the targets that are not in the member cache
+        targets.update(await get_members(interaction.guild, [member_id for member_id, member in targets.items() if member is None]))
+    bucket = f"{verb}:{interaction.guild.id}"
+    jobs = []
+    job_targets = []
+    for member_id, member in targets.items():
+        label = member.mention if member else f"<@{member_id}>"
+        action = make_action(member_id, member)
+        if action is None:
+            problems.append(f"{label}: not in the server")
+        else:
+            jobs.append((bucket, label, action))
+            job_targets.append(member or member_id)
+    results = await moderation_queue.run(jobs, on_progress=bulk_progress_reporter(interaction, title))
+    succeeded = [target for target, (_, error) in zip(job_targets, results) if error is None]
+    for target in succeeded:
+        audit_store.record(interaction.guild.id, verb, target, interaction.user, reason)
+    embed = bulk_summary_embed(title, results, problems, reason, interaction.user, color)
+    await interaction.edit_original_response(content=None, embed=embed)
+    return succeeded
+
+
+# Slash command: Bulk Kick
+@bot.tree.command(name="bulk_kick", description="Kick many members at once.")
+@role_required("moderation")
+@app_commands.describe(
+    member_ids="Member IDs or mentions separated by spaces or commas",
+    role="Kick every member with this role",
+    joined_within="Kick members who joined in the last N minutes",
+    reason="Reason for the kick"
+)
+async def bulk_kick(interaction: discord.Interaction, member_ids: str = None, role: discord.Role = None, joined_within: int = None, reason: str = "No reason provided"):
+    if not interaction.user.guild_permissions.kick_members:
+        await interaction.response.send_message("You don't have permission to kick members.", ephemeral=True)
+        return
+    guild = interaction.guild
+    targets, problems = await collect_bulk_targets(interaction, member_ids, role, joined_within)
+
+    def make_action(member_id, member):
+        return lambda: guild.kick(discord.Object(id=member_id), reason=reason)
+
+    await run_bulk_action(interaction, "kick", "Bulk Kick", 0xff0000, targets, problems, reason, make_action)
+
+
+# Slash command: Bulk Ban
+@bot.tree.command(name="bulk_ban", description="Ban many members at once.")
+@role_required("moderation")
+@app_commands.describe(
+    member_ids="Member or user IDs or mentions separated by spaces or commas",
+    role="Ban every member with this role",
+    joined_within="Ban members who joined in the last N minutes",
+    reason="Reason for the ban"
+)
+async def bulk_ban(interaction: discord.Interaction, member_ids: str = None, role: discord.Role = None, joined_within: int = None, reason: str = "No reason provided"):
+    if not interaction.user.guild_permissions.ban_members:
+        await interaction.response.send_message("You don't have permission to ban members.", ephemeral=True)
+        return
+    guild = interaction.guild
+    targets, problems = await collect_bulk_targets(interaction, member_ids, role, joined_within)
+
+    def make_action(member_id, member):
+        return lambda: guild.ban(discord.Object(id=member_id), reason=reason, delete_message_seconds=0)
+
+    await run_bulk_action(interaction, "ban", "Bulk Ban", 0x0000ff, targets, problems, reason, make_action)
+
+
+# Slash command: Bulk Timeout
+@bot.tree.command(name="bulk_timeout", description="Put many members in timeout at once.")
+@role_required("moderation")
+@app_commands.describe(
+    duration="Timeout duration in seconds",
+    member_ids="Member IDs or mentions separated by spaces or commas",
+    role="Time out every member with this role",
+    joined_within="Time out members who joined in the last N minutes",
+    reason="Reason for the timeout"
+)
+async def bulk_timeout(interaction: discord.Interaction, duration: int, member_ids: str = None, role: discord.Role = None, joined_within: int = None, reason: str = "No reason provided"):
+    if not interaction.user.guild_permissions.moderate_members:
+        await interaction.response.send_message("You don't have permission to moderate members.", ephemeral=True)
+        return
+    if not 0 < duration <= MAX_TIMEOUT_SECONDS:
+        await interaction.response.send_message("Timeouts must last between 1 second and 28 days.", ephemeral=True)
+        return
+    targets, problems = await collect_bulk_targets(interaction, member_ids, role, joined_within)
+    until = discord.utils.utcnow() + timedelta(seconds=duration)
+
+    def make_action(member_id, member):
+        if member is None:
+            return None
+        return lambda: member.timeout(until, reason=reason)
+
+    timed_out = await run_bulk_action(interaction, "timeout", "Bulk Timeout", 0xffff00, targets, problems, reason, make_action, need_members=True)
+    for member in timed_out:
+        await expiry_scheduler.add(interaction.guild.id, "timeout", member.id, until.timestamp(), reason=reason)
+
+
+# --- Expiring moderation actions ---
+MAX_TIMEOUT_SECONDS = 28 * 86400  # the longest timeout Discord accepts
+EXPIRY_RETRY_DELAY = 300  # seconds before a reversal that hit a server or network error is tried again
+DURATION_PART = re.compile(r"(\d+)\s*([smhdw])")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+EXPIRY_AUDIT_ACTIONS = {"ban": "unban", "role": "role_expired", "timeout": "timeout_expired"}
+expiry_queue = ActionQueue()
+
+Expiry = namedtuple("Expiry", "id guild_id kind target_id role_id due_at reason")
+
+
+def parse_duration(text: str) -> int:
+    """Seconds in a duration such as 90m, 12h or 1d12h; a bare number is seconds."""
+    text = text.strip().lower()
+    if text.isdigit():
+        seconds = int(text)
+    else:
+        parts = DURATION_PART.findall(text)
+        if not parts or DURATION_PART.sub("", text).strip():
+            raise ValueError(f"invalid duration {text!r}")
+        seconds = sum(int(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+    if seconds <= 0:
+        raise ValueError("duration must be positive")
+    return seconds
+
+
+def owns_guild(guild_id: int) -> bool:
+    # Each shard process reverses actions only for guilds on its own shards
+    return PROCESS_SHARD_IDS is None or (guild_id >> 22) % SHARD_COUNT in PROCESS_SHARD_IDS
+
+
+class ExpiryScheduler:
+    """Pending reversals of temporary actions, stored in SQLite and kept in a min-heap by due time.
+
+    The loop sleeps until the earliest reversal is due instead of polling. A reversal is deleted
+    only after it ran, so a crash in between repeats it on restart; unbans and role removals are
+    harmless to repeat.
+    """
+
+    def __init__(self, store: AuditStore):
+        self.store = store
+        self.entries = {}  # id -> Expiry
+        self.by_target = {}  # (guild id, kind, target id, role id) -> id of the pending reversal
+        self.heap = []  # (due_at, id); stale entries are skipped when popped
+        self.wakeup = None
+        self.task = None
+
+    def _load(self):
+        with closing(self.store.connect()) as connection, connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS expirations (
+                    id INTEGER PRIMARY KEY,
+                    guild_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    target_id INTEGER NOT NULL,
+                    role_id INTEGER,
+                    due_at REAL NOT NULL,
+                    reason TEXT
+                );
+                CREATE INDEX IF NOT EXISTS expirations_due ON expirations (due_at);
+            """)
+            return [Expiry(*row) for row in connection.execute(f"SELECT {', '.join(Expiry._fields)} FROM expirations")]
+
+    def _replace(self, old_id, entry: Expiry):
+        with closing(self.store.connect()) as connection, connection:
+            if old_id is not None:
+                connection.execute("DELETE FROM expirations WHERE id = ?", (old_id,))
+            cursor = connection.execute(
+                "INSERT INTO expirations (guild_id, kind, target_id, role_id, due_at, reason) VALUES (?, ?, ?, ?, ?, ?)",
+                entry[1:],
+            )
+            return cursor.lastrowid
+
+    def _update(self, sql: str, params):
+        with closing(self.store.connect()) as connection, connection:
+            connection.execute(sql, params)
+
+    async def start(self):
+        if self.task is not None and not self.task.done():
+            return
+        entries = [entry for entry in await asyncio.to_thread(self._load) if owns_guild(entry.guild_id)]
+        self.entries = {entry.id: entry for entry in entries}
+        self.by_target = {(entry.guild_id, entry.kind, entry.target_id, entry.role_id): entry.id for entry in entries}
+        self.heap = [(entry.due_at, entry.id) for entry in entries]
+        heapq.heapify(self.heap)
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+        print(f"[INFO] Expiry scheduler started with {len(self.entries)} pending reversals.")
+
+    async def add(self, guild_id: int, kind: str, target_id: int, due_at: float, role_id: int = None, reason: str = None):
+        """Persist and schedule a reversal, replacing a pending one for the same target."""
+        key = (guild_id, kind, target_id, role_id)
+        old_id = self.by_target.get(key)
+        entry = Expiry(None, guild_id, kind, target_id, role_id, due_at, reason)
+        entry = entry._replace(id=await asyncio.to_thread(self._replace, old_id, entry))
+        self.entries.pop(old_id, None)
+        self.entries[entry.id] = entry
+        self.by_target[key] = entry.id
+        heapq.heappush(self.heap, (due_at, entry.id))
+        if self.wakeup:
+            self.wakeup.set()
+        return entry
+
+    async def remove(self, entry: Expiry):
+        await asyncio.to_thread(self._update, "DELETE FROM expirations WHERE id = ?", (entry.id,))
+        self.entries.pop(entry.id, None)
+        key = (entry.guild_id, entry.kind, entry.target_id, entry.role_id)
+        if self.by_target.get(key) == entry.id:
+            del self.by_target[key]
+
+    def pending(self, guild_id: int):
+        return sorted((entry for entry in self.entries.values() if entry.guild_id == guild_id), key=lambda entry: entry.due_at)
+
+    def _peek(self):
+        while self.heap:
+            due_at, entry_id = self.heap[0]
+            entry = self.entries.get(entry_id)
+            if entry and entry.due_at == due_at:
+                return entry
+            heapq.heappop(self.heap)
+        return None
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            entry = self._peek()
+            delay = entry.due_at - time.time() if entry else None
+            if delay is None or delay > 0:
+                await wait_or_timeout(self.wakeup.wait(), delay)
+                continue
+            # Everything already due goes out together, e.g. reversals that came due while offline
+            due = []
+            while entry and entry.due_at <= time.time():
+                heapq.heappop(self.heap)
+                due.append(entry)
+                entry = self._peek()
+            try:
+                await self.fire(due)
+            except Exception as e:
+                # Reversals that were not settled stay scheduled instead of being dropped with the loop
+                print(f"[ERROR] Expiry reversals failed, retrying in {EXPIRY_RETRY_DELAY}s: {e}")
+                for entry in due:
+                    if self.entries.get(entry.id) == entry:
+                        self._retry_later(entry)
+
+    def _retry_later(self, entry: Expiry):
+        retry = entry._replace(due_at=time.time() + EXPIRY_RETRY_DELAY)
+        self.entries[retry.id] = retry
+        heapq.heappush(self.heap, (retry.due_at, retry.id))
+        return retry
+
+    @staticmethod
+    def reversal(entry: Expiry):
+        if entry.kind == "ban":
+            return functools.partial(bot.http.unban, entry.target_id, entry.guild_id, reason="Temporary ban expired")
+        if entry.kind == "role":
+            return functools.partial(bot.http.remove_role, entry.guild_id, entry.target_id, entry.role_id, reason="Temporary role expired")
+        return None  # Discord lifts timeouts by itself; only the audit entry is written
+
+    async def fire(self, entries):
+        jobs = [(f"{entry.kind}:{entry.guild_id}", entry, self.reversal(entry)) for entry in entries]
+        results = await expiry_queue.run([job for job in jobs if job[2]])
+        errors = {entry.id: error for entry, error in results}
+        for entry in entries:
+            error = errors.get(entry.id)
+            if isinstance(error, (discord.RateLimited, *NETWORK_ERRORS)) or (isinstance(error, discord.HTTPException) and error.status >= 500):
+                print(f"[WARN] Could not reverse {entry.kind} for {entry.target_id}, retrying in {EXPIRY_RETRY_DELAY}s: {error}")
+                retry = self._retry_later(entry)
+                await asyncio.to_thread(self._update, "UPDATE expirations SET due_at = ? WHERE id = ?", (retry.due_at, retry.id))
+                continue
+            if error is not None and not isinstance(error, discord.NotFound):
+                print(f"[ERROR] Could not reverse {entry.kind} for {entry.target_id} in {entry.guild_id}: {error}")
+            else:
+                # NotFound means someone already lifted it by hand
+                audit_store.record(entry.guild_id, EXPIRY_AUDIT_ACTIONS[entry.kind], entry.target_id, bot.user, entry.reason)
+            await self.remove(entry)
+
+
+expiry_scheduler = ExpiryScheduler(audit_store)
+
+
+# Slash command: Temporary Ban
+@bot.tree.command(name="tempban", description="Ban a user for a limited time.")
+@role_required("moderation")
+@app_commands.describe(user="The user to ban", duration="How long, e.g. 30m, 12h, 7d or 1d12h", reason="Reason for the ban")
+async def tempban(interaction: discord.Interaction, user: discord.User, duration: str, reason: str = "No reason provided"):
+    if not interaction.user.guild_permissions.ban_members:
+        await interaction.response.send_message("You don't have permission to ban members.", ephemeral=True)
+        return
+    try:
+        seconds = parse_duration(duration)
+    except ValueError:
+        await interaction.response.send_message("Invalid duration. Use something like 30m, 12h, 7d or 1d12h.", ephemeral=True)
+        return
+    try:
+        await interaction.guild.ban(user, reason=reason, delete_message_seconds=0)
+    except discord.HTTPException as e:
+        print(f"[ERROR] /tempban of {user.id} failed: {e}")
+        await interaction.response.send_message(f"Could not ban {user.mention}. Check my permissions and role position.", ephemeral=True)
+        return
+    due_at = time.time() + seconds
+    await expiry_scheduler.add(interaction.guild.id, "ban", user.id, due_at, reason=reason)
+    audit_store.record(interaction.guild.id, "tempban", user, interaction.user, f"{reason} ({duration})")
+    embed = discord.Embed(
+        title="Member Temporarily Banned",
+        description=f"{user.mention} has been banned until <t:{int(due_at)}:f>.",
+        color=0x0000ff
+    )
+    embed.add_field(name="Reason", value=reason, inline=False)
+    embed.set_footer(text=f"Actioned by {interaction.user}")
+    await interaction.response.send_message(embed=embed)
+
+
+# Slash command: Temporary Role
+@bot.tree.command(name="temprole", description="Give a member a role that is removed again after a while.")
+@role_required("whitelist")
+@app_commands.describe(
+    member="The member to give the role to",
+    duration="How long, e.g. 30m, 12h, 7d or 1d12h",
+    role="The role to grant; defaults to the whitelist role",
+    reason="Reason for the grant"
+)
+async def temprole(interaction: discord.Interaction, member: discord.Member, duration: str, role: discord.Role = None, reason: str = "No reason provided"):
+    guild = interaction.guild
+    role = role or guild.get_role(config.whitelist_role_id)
+    if role is None:
+        await interaction.response.send_message("The whitelist role does not exist in this server.", ephemeral=True)
+        return
+    if role.id != config.whitelist_role_id and not has_required_role(interaction, "management"):
+        await interaction.response.send_message("Only management can grant roles other than the whitelist role.", ephemeral=True)
+        return
+    if role.managed or role >= guild.me.top_role:
+        await interaction.response.send_message(f"I can't assign {role.mention}; it is managed or above my highest role.", ephemeral=True)
+        return
+    try:
+        seconds = parse_duration(duration)
+    except ValueError:
+        await interaction.response.send_message("Invalid duration. Use something like 30m, 12h, 7d or 1d12h.", ephemeral=True)
+        return
+    try:
+        await member.add_roles(role, reason=reason)
+    except discord.HTTPException as e:
+        print(f"[ERROR] /temprole {role.id} for {member.id} failed: {e}")
+        await interaction.response.send_message(f"Could not give {role.mention} to {member.mention}.", ephemeral=True)
+        return
+    due_at = time.time() + seconds
+    await expiry_scheduler.add(guild.id, "role", member.id, due_at, role_id=role.id, reason=reason)
+    audit_store.record(guild.id, "temprole", member, interaction.user, f"{role.name}: {reason} ({duration})")
+    embed = discord.Embed(
+        title="Temporary Role Granted",
+        description=f"{member.mention} has {role.mention} until <t:{int(due_at)}:f>.",
+        color=0x00ff00
+    )
+    embed.add_field(name="Reason", value=reason, inline=False)
+    embed.set_footer(text=f"Actioned by {interaction.user}")
+    await interaction.response.send_message(embed=embed)
+
+
+# Slash command: List pending expirations
+@bot.tree.command(name="expirations", description="List temporary bans, roles and timeouts that have not expired yet.")
+@role_required("moderation")
+async def expirations(interaction: discord.Interaction):
+    entries = expiry_scheduler.pending(interaction.guild.id)
+    labels = {"ban": "Ban", "role": "Role", "timeout": "Timeout"}
+    lines = []
+    for entry in entries[:25]:
+        line = f"**{labels[entry.kind]}** <@{entry.target_id}>"
+        if entry.role_id:
+            line += f" <@&{entry.role_id}>"
+        lines.append(f"{line} — ends <t:{int(entry.due_at)}:R>")
+    embed = discord.Embed(title="Pending Expirations", description="\n".join(lines) or "Nothing is pending.", color=0x3498db)
+    if len(entries) > 25:
+        embed.set_footer(text=f"Showing the next 25 of {len(entries)}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+# --- Announcement fan-out ---
+CHANNEL_REFERENCE = re.compile(r"<#(\d+)>|(\d{15,20})")
+announcement_queue = ActionQueue()
+
+
+def parse_hex_color(text: str) -> int:
+    value = int(text.strip().lstrip("#"), 16)
+    if value > 0xFFFFFF:
+        raise ValueError("color out of range")
+    return value
+
+
+def collect_fanout_channels(interaction: discord.Interaction, channels: str, group: str):
+    """Return (channel ids, problems) for a configured group plus channels listed by mention or ID.
+
+    Listed channels must be in this server and writable by the caller; groups come from the
+    config and may span guilds.
+    """
+    channel_ids = []
+    problems = []
+    if group:
+        if group in config.channel_groups:
+            channel_ids.extend(config.channel_groups[group])
+        else:
+            problems.append(f"Unknown channel group `{group}`")
+    for raw in re.split(r"[\s,]+", channels.strip()) if channels else []:
+        match = CHANNEL_REFERENCE.fullmatch(raw)
+        channel = interaction.guild.get_channel(int(match.group(1) or match.group(2))) if match else None
+        if not isinstance(channel, discord.abc.Messageable):
+            problems.append(f"`{raw}` is not a text channel in this server")
+        elif not channel.permissions_for(interaction.user).send_messages:
+            problems.append(f"{channel.mention}: you can't post there")
+        else:
+            channel_ids.append(channel.id)
+    return list(dict.fromkeys(channel_ids)), problems
+
+
+def describe_send_error(error: Exception) -> str:
+    if isinstance(error, discord.Forbidden):
+        return "missing access"
+    if isinstance(error, discord.NotFound):
+        return "channel not found"
+    if isinstance(error, discord.RateLimited):
+        return "still rate limited after retries"
+    return f"Discord returned {error.status}"
+
+
+async def fan_out(embed: discord.Embed, content, channel_ids, on_progress=None):
+    """Send one message to every channel through the send queue. Returns [(channel mention, error or None)]."""
+    # The payload is serialized once and every send reuses it; no Message objects are built for the replies
+    with discord.http.handle_message_parameters(content=content, embed=embed, previous_allowed_mentions=bot.allowed_mentions) as params:
+        jobs = [
+            (f"send:{channel_id}", f"<#{channel_id}>", functools.partial(bot.http.send_message, channel_id, params=params))
+            for channel_id in channel_ids
+        ]
+        results = await announcement_queue.run(jobs, on_progress=on_progress)
+    for label, error in results:
+        if error:
+            print(f"[WARN] Announcement to {label} failed: {error}")
+    return results
+
+
+def delivery_report_embed(results, problems, actor):
+    failures = [f"{label}: {describe_send_error(error)}" for label, error in results if error] + problems
+    delivered = sum(1 for _, error in results if error is None)
+    embed = discord.Embed(
+        title="Announcement Delivery",
+        description=f"Delivered to {delivered} of {len(results)} channels.",
+        color=0xffa500 if failures else 0x00ff00
+    )
+    if failures:
+        shown = "\n".join(failures[:10])
+        if len(failures) > 10:
+            shown += f"\n…and {len(failures) - 10} more"
+        embed.add_field(name="Not delivered", value=shown[:1024], inline=False)
+    embed.set_footer(text=f"Sent by {actor}")
+    return embed
+
+
+async def deliver_announcement(interaction: discord.Interaction, embed: discord.Embed, content, channel_ids, problems):
+    if not channel_ids:
+        await interaction.response.send_message("\n".join(problems) or "No channels to send to.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    results = await fan_out(embed, content, channel_ids, on_progress=bulk_progress_reporter(interaction, "Announcement"))
+    await interaction.edit_original_response(content=None, embed=delivery_report_embed(results, problems, interaction.user))
+
+
+async def channel_group_autocomplete(interaction: discord.Interaction, current: str):
+    current = current.lower()
+    return [app_commands.Choice(name=name, value=name) for name in config.channel_groups if current in name.lower()][:AUTOCOMPLETE_LIMIT]
+
+
+# Slash command: Custom Message
+@bot.tree.command(name="announce", description="Create a custom announcement.")
+@role_required()
+@app_commands.describe(
+    title="The title of the announcement",
+    description="The description of the announcement",
+    color="The color of the embed (hex format, e.g., #ff0000)",
+    image_url="The image URL for the embed",
+    channels="Post in these channels instead of here (mentions or IDs)",
+    group="Post in every channel of this configured group"
+)
+@app_commands.autocomplete(group=channel_group_autocomplete)
+async def announce(interaction: discord.Interaction, title: str, description: str, color: str = None, image_url: str = None, channels: str = None, group: str = None):
+    try:
+        color = parse_hex_color(color) if color else 0x00ff00
+    except ValueError:
+        await interaction.response.send_message("Invalid color format. Use hex format, e.g., #ff0000.", ephemeral=True)
+        return
+    embed = discord.Embed(title=title, description=description, color=color)
+    embed.set_footer(text=f"Announced by {interaction.user}")
+    if image_url:
+        embed.set_image(url=image_url)
+    if channels or group:
+        channel_ids, problems = collect_fanout_channels(interaction, channels, group)
+        await deliver_announcement(interaction, embed, None, channel_ids, problems)
+        return
+    try:
+        await interaction.response.send_message(embed=embed)
+    except discord.HTTPException as e:
+        print(f"[ERROR] /announce failed: {e}")
+        await interaction.response.send_message("Discord rejected the announcement. Check the image URL.", ephemeral=True)
+
+# --- Polls ---
+POLL_FILE = f"polls-{PROCESS_INDEX}.json" if SHARDED else "polls.json"
+POLL_MAX_OPTIONS = 25  # five rows of five buttons
+POLL_EDIT_INTERVAL = 5.0  # at most one live tally edit per poll in this many seconds
+POLL_SAVE_INTERVAL = 30  # seconds between saves of changed polls
+POLL_BAR_WIDTH = 12
+
+
+class Poll:
+    def __init__(self, poll_id, guild_id, channel_id, question, options, author_id,
+                 closes_at=None, message_id=None, votes=None, closed=False):
+        self.id = poll_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.question = question
+        self.options = options
+        self.author_id = author_id
+        self.closes_at = closes_at  # unix timestamp or None
+        self.closed = closed
+        self.votes = votes or {}  # user id -> option index
+        self.counts = [0] * len(options)
+        for option in self.votes.values():
+            self.counts[option] += 1
+        self.last_edit = 0.0
+        self.edit_pending = False  # votes not yet shown in the message
+        self.edit_task = None
+        self.close_task = None
+
+    def vote(self, user_id: int, option: int):
+        """Record a vote and return the option now chosen, or None when the vote was withdrawn."""
+        previous = self.votes.get(user_id)
+        if previous is not None:
+            self.counts[previous] -= 1
+        if previous == option:
+            del self.votes[user_id]
+            return None
+        self.votes[user_id] = option
+        self.counts[option] += 1
+        return option
+
+    def embed(self):
+        total = sum(self.counts)
+        embed = discord.Embed(
+            title="Poll Results" if self.closed else "Poll",
+            description=self.question,
+            color=0x95a5a6 if self.closed else 0x3498db
+        )
+        leader = max(self.counts) if total else None
+        for i, option in enumerate(self.options):
+            count = self.counts[i]
+            share = count / total if total else 0
+            bar = "█" * round(share * POLL_BAR_WIDTH) + "░" * (POLL_BAR_WIDTH - round(share * POLL_BAR_WIDTH))
+            name = f"{i + 1}. {option}"
+            if self.closed and count == leader:
+                name = f"🏆 {name}"
+            embed.add_field(name=name[:256], value=f"`{bar}` {count} vote{'s' if count != 1 else ''} ({share:.0%})", inline=False)
+        status = "Closed" if self.closed else f"Closes <t:{int(self.closes_at)}:R>" if self.closes_at else "Open"
+        embed.add_field(name="Status", value=f"{status} • {total} total votes", inline=False)
+        embed.set_footer(text=f"Poll ID {self.id}")
+        return embed
+
+    def view(self):
+        view = View(timeout=None)
+        for i, option in enumerate(self.options):
+            view.add_item(PollButton(self.id, i, f"{i + 1}. {option}"[:80]))
+        return view
+
+    def to_dict(self):
+        return {
+            "id": self.id, "guild_id": self.guild_id, "channel_id": self.channel_id, "message_id": self.message_id,
+            "question": self.question, "options": self.options, "author_id": self.author_id,
+            "closes_at": self.closes_at, "closed": self.closed,
+            "votes": {str(user_id): option for user_id, option in self.votes.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["id"], data["guild_id"], data["channel_id"], data["question"], data["options"], data["author_id"],
+            closes_at=data.get("closes_at"), message_id=data.get("message_id"),
+            votes={int(user_id): option for user_id, option in data.get("votes", {}).items()},
+            closed=data.get("closed", False),
+        )
+
+
+class PollButton(discord.ui.DynamicItem[discord.ui.Button], template=r"poll:(?P<poll_id>[0-9a-f]+):(?P<option>[0-9]+)"):
+    def __init__(self, poll_id: str, option: int, label: str = None):
+        super().__init__(discord.ui.Button(label=label, style=discord.ButtonStyle.primary, custom_id=f"poll:{poll_id}:{option}"))
+        self.poll_id = poll_id
+        self.option = option
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["poll_id"], int(match["option"]), item.label)
+
+    async def callback(self, interaction: discord.Interaction):
+        poll = polls.get(self.poll_id)
+        if poll is None or poll.closed or self.option >= len(poll.options):
+            await interaction.response.send_message("This poll is closed.", ephemeral=True)
+            return
+        chosen = poll.vote(interaction.user.id, self.option)
+        polls_dirty.add(poll.id)
+        schedule_poll_edit(poll)
+        if chosen is None:
+            await interaction.response.send_message("Your vote was removed.", ephemeral=True)
+        else:
+            await interaction.response.send_message(f"You voted for **{poll.options[chosen]}**.", ephemeral=True)
+
+
+polls = {}  # poll id -> Poll
+polls_dirty = set()  # poll ids changed since the last save
+bot.add_dynamic_items(PollButton)
+
+
+def poll_message(poll: Poll):
+    return bot.get_partial_messageable(poll.channel_id).get_partial_message(poll.message_id)
+
+
+def schedule_poll_edit(poll: Poll):
+    # A burst of votes collapses into one edit per POLL_EDIT_INTERVAL
+    poll.edit_pending = True
+    if poll.edit_task is None or poll.edit_task.done():
+        poll.edit_task = asyncio.create_task(edit_poll_message(poll))
+
+
+async def edit_poll_message(poll: Poll):
+    # Votes arriving while an edit is in flight set the flag again and get one more edit
+    while poll.edit_pending:
+        await asyncio.sleep(max(0.0, poll.last_edit + POLL_EDIT_INTERVAL - time.monotonic()))
+        poll.last_edit = time.monotonic()
+        poll.edit_pending = False
+        if poll.closed:
+            return
+        try:
+            await poll_message(poll).edit(embed=poll.embed())
+        except discord.HTTPException as e:
+            print(f"[ERROR] Could not update poll {poll.id}: {e}")
+
+
+def save_polls():
+    tmp_path = f"{POLL_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump([poll.to_dict() for poll in polls.values() if not poll.closed], f)
+    os.replace(tmp_path, POLL_FILE)
+    polls_dirty.clear()
+
+
+def load_polls():
+    if polls or not os.path.exists(POLL_FILE):
+        return
+    with open(POLL_FILE, "r", encoding="utf-8") as f:
+        for data in json.load(f):
+            poll = Poll.from_dict(data)
+            polls[poll.id] = poll
+            schedule_poll_close(poll)
+    print(f"[INFO] Restored {len(polls)} open polls.")
+
+
+@tasks.loop(seconds=POLL_SAVE_INTERVAL)
+async def poll_saver():
+    if polls_dirty:
+        save_polls()
+
+
+def schedule_poll_close(poll: Poll):
+    if poll.closes_at and (poll.close_task is None or poll.close_task.done()):
+        poll.close_task = asyncio.create_task(close_poll_later(poll))
+
+
+async def close_poll_later(poll: Poll):
+    await asyncio.sleep(max(0.0, poll.closes_at - time.time()))
+    await close_poll(poll)
+
+
+async def close_poll(poll: Poll):
+    if poll.closed:
+        return
+    poll.closed = True
+    polls.pop(poll.id, None)
+    save_polls()
+    for task in (poll.edit_task, poll.close_task):
+        if task and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+    try:
+        await poll_message(poll).edit(embed=poll.embed(), view=None)
+    except discord.HTTPException as e:
+        print(f"[ERROR] Could not post results for poll {poll.id}: {e}")
+
+
+# Slash command: Poll
+@bot.tree.command(name="poll", description="Create a poll with multiple options.")
+@role_required()
+@app_commands.describe(
+    question="The poll question",
+    options="Comma-separated list of options",
+    duration="Close the poll automatically after this many minutes"
+)
+async def poll(interaction: discord.Interaction, question: str, options: str, duration: int = None):
+    options_list = [option.strip() for option in options.split(',') if option.strip()]
+    if len(options_list) < 2:
+        await interaction.response.send_message("Please provide at least two options.", ephemeral=True)
+        return
+    if len(options_list) > POLL_MAX_OPTIONS:
+        await interaction.response.send_message(f"Polls can have at most {POLL_MAX_OPTIONS} options.", ephemeral=True)
+        return
+
+    new_poll = Poll(
+        uuid.uuid4().hex[:8], interaction.guild.id, interaction.channel.id, question, options_list, interaction.user.id,
+        closes_at=time.time() + duration * 60 if duration else None,
+    )
+    message = await interaction.channel.send(embed=new_poll.embed(), view=new_poll.view())
+    new_poll.message_id = message.id
+    polls[new_poll.id] = new_poll
+    save_polls()
+    schedule_poll_close(new_poll)
+
+    await interaction.response.send_message(f"Poll created! ID `{new_poll.id}`", ephemeral=True)
+
+
+# Slash command: Close Poll
+@bot.tree.command(name="poll_close", description="Close a poll and post the final results.")
+@role_required()
+@app_commands.describe(poll_id="The poll ID shown in the poll's footer")
+async def poll_close(interaction: discord.Interaction, poll_id: str):
+    existing = polls.get(poll_id.strip())
+    if existing is None or existing.guild_id != interaction.guild.id:
+        await interaction.response.send_message(f"No open poll with ID `{poll_id}`.", ephemeral=True)
+        return
+    await close_poll(existing)
+    await interaction.response.send_message(f"Poll `{existing.id}` closed.", ephemeral=True)
+
+
+# Slash command: Set Activity
+@bot.tree.command(name="setactivity", description="Set a custom bot activity.")
+@role_required()
+@app_commands.describe(
+    activity_type="Type of activity (playing, watching, listening)",
+    description="The description of the activity"
+)
+async def setactivity(interaction: discord.Interaction, activity_type: str, description: str):
+    activity_type = activity_type.lower()
+    if activity_type == "playing":
+        activity = discord.Game(name=description)
+    elif activity_type == "watching":
+        activity = discord.Activity(type=discord.ActivityType.watching, name=description)
+    elif activity_type == "listening":
+        activity = discord.Activity(type=discord.ActivityType.listening, name=description)
+    else:
+        await interaction.response.send_message("Invalid activity type. Choose from: playing, watching, listening, competing.", ephemeral=True)
+        return
+
+    await bot.change_presence(activity=activity)
+    await interaction.response.send_message(f"Bot activity set to: {activity_type.capitalize()} {description}", ephemeral=True)
+
+# Slash command: Help
+@bot.tree.command(name="help", description="Show all available commands and their descriptions.")
+@role_required()
+async def help_command(interaction: discord.Interaction):
+    embed = discord.Embed(
+        title="Help - List of Commands",
+        description="Here are all the available commands in the bot:",
+        color=0x00ff00
+    )
+    for command in bot.tree.get_commands():
+        embed.add_field(name=f"/{command.name}", value=command.description, inline=False)
+    embed.set_footer(text=f"Requested by {interaction.user}")
+    await interaction.response.send_message(embed=embed)
+
+
+# Slash command: Check Ping
+@bot.tree.command(name="ping", description="Check the bot's latency.")
+@role_required()
+async def ping(interaction: discord.Interaction):
+    latency = round(bot.latency * 1000) 
+    embed = discord.Embed(
+        title="Pong! 🏓",
+        description=f"The bot's latency is `{latency}ms`.",
+        color=0x00ff00
+    )
+    if SHARDED:
+        lines = []
+        for stats in read_shard_stats():
+            shards = ", ".join(f"#{shard_id} `{value * 1000:.0f}ms`" for shard_id, value in sorted(stats["shards"].items(), key=lambda item: int(item[0])))
+            lines.append(f"Process {stats['process']}{' (stale)' if stats['stale'] else ''}: {shards or 'connecting'}")
+        embed.add_field(name="Shards", value="\n".join(lines)[:1024] or "No shard stats yet.", inline=False)
+    await interaction.response.send_message(embed=embed)
+    
+    
+# --- System metrics sampler ---
+METRICS_SAMPLE_INTERVAL = 5  # seconds between samples
+METRICS_HISTORY_SECONDS = 3600  # keep the last hour for sparklines
+LAG_PROBE_SECONDS = 0.1
+SPARKLINE_BARS = "▁▂▃▄▅▆▇█"
+SPARKLINE_WIDTH = 60
+
+MetricsSample = namedtuple(
+    "MetricsSample",
+    "time cpu process_cpu rss memory_used memory_total memory_percent loop_lag tasks latency",
+)
+metrics_history = deque(maxlen=METRICS_HISTORY_SECONDS // METRICS_SAMPLE_INTERVAL)
+
+
+@functools.cache
+def bot_process():
+    return psutil.Process(os.getpid())
+
+
+async def measure_loop_lag():
+    # How late the loop wakes a short sleep is how long other callbacks are holding it
+    start = time.perf_counter()
+    await asyncio.sleep(LAG_PROBE_SECONDS)
+    return max(0.0, time.perf_counter() - start - LAG_PROBE_SECONDS)
+
+
+@tasks.loop(seconds=METRICS_SAMPLE_INTERVAL)
+async def metrics_sampler():
+    loop_lag = await measure_loop_lag()
+    memory_info = psutil.virtual_memory()
+    latency = bot.latency if math.isfinite(bot.latency) else 0.0
+    metrics_history.append(MetricsSample(
+        time=time.time(),
+        cpu=psutil.cpu_percent(interval=None),
+        process_cpu=bot_process().cpu_percent(interval=None),
+        rss=bot_process().memory_info().rss,
+        memory_used=memory_info.used,
+        memory_total=memory_info.total,
+        memory_percent=memory_info.percent,
+        loop_lag=loop_lag,
+        tasks=len(asyncio.all_tasks()),
+        latency=latency,
+    ))
+    if SHARDED:
+        write_shard_stats(metrics_history[-1])
+
+
+@metrics_sampler.before_loop
+async def prime_cpu_counters():
+    # The first cpu_percent(interval=None) call only sets the baseline
+    psutil.cpu_percent(interval=None)
+    bot_process().cpu_percent(interval=None)
+
+
+def recent_samples(seconds: int):
+    cutoff = time.time() - seconds
+    samples = []
+    for sample in reversed(metrics_history):
+        if sample.time < cutoff:
+            break
+        samples.append(sample)
+    return samples
+
+
+def average(samples, field: str):
+    return sum(getattr(sample, field) for sample in samples) / len(samples) if samples else 0.0
+
+
+def sparkline(values):
+    if not values:
+        return "n/a"
+    # Downsample to a fixed width by averaging consecutive buckets
+    step = max(1, math.ceil(len(values) / SPARKLINE_WIDTH))
+    buckets = [sum(values[i:i + step]) / len(values[i:i + step]) for i in range(0, len(values), step)]
+    low, high = min(buckets), max(buckets)
+    spread = (high - low) or 1
+    return "".join(SPARKLINE_BARS[int((value - low) / spread * (len(SPARKLINE_BARS) - 1))] for value in buckets)
+
+
+# Slash command: System Info
+@bot.tree.command(name="systeminfo", description="Check the bot's hosting system information.")
+@role_required()
+@app_commands.describe(history="Include sparklines for the last hour")
+async def systeminfo(interaction: discord.Interaction, history: bool = False):
+    if not metrics_history:
+        await interaction.response.send_message("Metrics are still being collected, try again in a few seconds.", ephemeral=True)
+        return
+
+    latest = metrics_history[-1]
+    last_minute = recent_samples(60)
+    last_five = recent_samples(300)
+    uptime = datetime.now() - datetime.fromtimestamp(bot_process().create_time())
+
+    # Create an embed
+    embed = discord.Embed(
+        title="Bot Hosting System Information",
+        color=0x3498db
+    )
+    embed.add_field(
+        name="CPU Usage",
+        value=f"{latest.cpu}% (1m avg {average(last_minute, 'cpu'):.1f}%, 5m avg {average(last_five, 'cpu'):.1f}%)\n"
+              f"Bot process: {latest.process_cpu:.1f}%",
+        inline=False
+    )
+    embed.add_field(
+        name="Memory Usage",
+        value=f"{latest.memory_used / (1024 ** 2):.2f} MB / {latest.memory_total / (1024 ** 2):.2f} MB ({latest.memory_percent}%)\n"
+              f"Bot RSS: {latest.rss / (1024 ** 2):.2f} MB",
+        inline=False
+    )
+    embed.add_field(
+        name="Event Loop",
+        value=f"Lag {latest.loop_lag * 1000:.1f} ms (5m avg {average(last_five, 'loop_lag') * 1000:.1f} ms), {latest.tasks} tasks",
+        inline=False
+    )
+    embed.add_field(
+        name="Gateway Latency",
+        value=f"{latest.latency * 1000:.0f} ms (5m avg {average(last_five, 'latency') * 1000:.0f} ms)",
+        inline=False
+    )
+    embed.add_field(name="Bot Uptime", value=str(uptime).split('.')[0], inline=False)
+    embed.add_field(name="Platform", value=os.name, inline=False)
+    embed.add_field(name="Python Version", value=os.sys.version.split(" ")[0], inline=False)
+    if LEAN_MEMBER_CACHE:
+        records = sum(len(index.records) for index in member_indexes.values())
+        compact = sum(index.memory_usage() for index in member_indexes.values())
+        saved = max(0, records * FULL_MEMBER_BYTES - compact)
+        embed.add_field(
+            name="Member Cache",
+            value=f"Lean mode: {records} records in {compact / (1024 ** 2):.2f} MB, "
+                  f"about {saved / (1024 ** 2):.2f} MB less than full Member objects ({len(member_lru)} fetched members cached)",
+            inline=False
+        )
+    if SHARDED:
+        lines = [
+            f"Process {stats['process']}{' (stale)' if stats['stale'] else ''}: {len(stats['shards'])} shards, {stats['guilds']} guilds, "
+            f"CPU {stats['cpu']:.1f}%, RSS {stats['rss'] / (1024 ** 2):.0f} MB, lag {stats['loop_lag'] * 1000:.1f} ms"
+            for stats in read_shard_stats()
+        ]
+        embed.add_field(name="Shard Processes", value="\n".join(lines)[:1024] or "No shard stats yet.", inline=False)
+    if history:
+        samples = list(metrics_history)
+        embed.add_field(name="CPU (last hour)", value=f"`{sparkline([s.cpu for s in samples])}`", inline=False)
+        embed.add_field(name="RSS (last hour)", value=f"`{sparkline([s.rss for s in samples])}`", inline=False)
+        embed.add_field(name="Loop Lag (last hour)", value=f"`{sparkline([s.loop_lag for s in samples])}`", inline=False)
+    embed.set_footer(text=f"Requested by {interaction.user} • sampled every {METRICS_SAMPLE_INTERVAL}s")
+
+    # Send the embed
+    await interaction.response.send_message(embed=embed)
+    
+# --- Command metrics reporting ---
+METRICS_HTTP_HOST = config.metrics_http_host
+METRICS_HTTP_PORT = config.metrics_http_port  # Prometheus-style /metrics endpoint, None disables it
+metrics_server = None
+
+
+def render_prometheus_metrics():
+    lines = [
+        "# HELP merp_command_latency_seconds Time from interaction creation until the first response was sent.",
+        "# TYPE merp_command_latency_seconds histogram",
+    ]
+    for name, metrics in sorted(command_metrics.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), metrics.buckets):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'merp_command_latency_seconds_bucket{{command="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'merp_command_latency_seconds_sum{{command="{name}"}} {metrics.total}')
+        lines.append(f'merp_command_latency_seconds_count{{command="{name}"}} {metrics.count}')
+    lines += ["# HELP merp_command_errors_total Handler errors per command.", "# TYPE merp_command_errors_total counter"]
+    lines += [f'merp_command_errors_total{{command="{name}"}} {m.errors}' for name, m in sorted(command_metrics.items())]
+    lines += [
+        "# HELP merp_command_deadline_misses_total Interactions not answered within 3 seconds.",
+        "# TYPE merp_command_deadline_misses_total counter",
+    ]
+    lines += [f'merp_command_deadline_misses_total{{command="{name}"}} {m.deadline_misses}' for name, m in sorted(command_metrics.items())]
+    if metrics_history:
+        latest = metrics_history[-1]
+        lines += [
+            "# TYPE merp_event_loop_lag_seconds gauge",
+            f"merp_event_loop_lag_seconds {latest.loop_lag}",
+            "# TYPE merp_gateway_latency_seconds gauge",
+            f"merp_gateway_latency_seconds {latest.latency}",
+            "# TYPE merp_asyncio_tasks gauge",
+            f"merp_asyncio_tasks {latest.tasks}",
+            "# TYPE merp_process_resident_memory_bytes gauge",
+            f"merp_process_resident_memory_bytes {latest.rss}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1] == b"/metrics":
+            status, body = "200 OK", render_prometheus_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_metrics_server():
+    global metrics_server
+    if METRICS_HTTP_PORT is None or metrics_server is not None:
+        return
+    try:
+        # Each shard process listens on its own port
+        port = METRICS_HTTP_PORT + PROCESS_INDEX
+        metrics_server = await asyncio.start_server(handle_metrics_request, METRICS_HTTP_HOST, port)
+        print(f"[INFO] Metrics endpoint listening on http://{METRICS_HTTP_HOST}:{port}/metrics")
+    except OSError as e:
+        print(f"[ERROR] Could not start metrics endpoint: {e}")
+
+
+# Slash command: Command Metrics
+@bot.tree.command(name="metrics", description="Show per-command latency and error statistics.")
+@role_required()
+async def metrics(interaction: discord.Interaction):
+    embed = discord.Embed(title="Command Metrics", color=0x3498db)
+    busiest = sorted(command_metrics.items(), key=lambda item: item[1].count, reverse=True)[:20]
+    for name, m in busiest:
+        embed.add_field(
+            name=f"/{name}",
+            value=f"{m.count} calls • p50 {m.percentile(0.5) * 1000:.0f} ms • p95 {m.percentile(0.95) * 1000:.0f} ms"
+                  f" • p99 {m.percentile(0.99) * 1000:.0f} ms\n{m.errors} errors • {m.deadline_misses} over 3s",
+            inline=False
+        )
+    if not busiest:
+        embed.description = "No commands recorded yet."
+    if metrics_history:
+        latest = metrics_history[-1]
+        embed.add_field(
+            name="Event Loop",
+            value=f"Lag {latest.loop_lag * 1000:.1f} ms (5m max {max((s.loop_lag for s in recent_samples(300)), default=0.0) * 1000:.1f} ms)",
+            inline=False
+        )
+    embed.set_footer(text=f"Requested by {interaction.user}")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+# --- Announcement scheduler ---
+SCHEDULE_FILE = "scheduled_jobs.json"
+SCHEDULE_CATCHUP_WINDOW = 6 * 3600  # missed runs younger than this are still sent after a restart
+SCHEDULE_RELOAD_INTERVAL = 30  # when sharded, how often the primary process picks up jobs added elsewhere
+
+
+class ScheduledJob:
+    def __init__(self, job_id, channel_id, message, timezone, cron=None, next_run=None, created_by=None):
+        self.id = job_id
+        self.channel_id = channel_id
+        self.message = message
+        self.timezone = timezone
+        self.cron = cron
+        self.next_run = next_run  # unix timestamp
+        self.created_by = created_by
+
+    def compute_next_run(self, after: datetime):
+        self.next_run = CronSpec(self.cron).next_after(after, pytz.timezone(self.timezone)).timestamp()
+
+    def to_dict(self):
+        return {
+            "id": self.id, "channel_id": self.channel_id, "message": self.message, "timezone": self.timezone,
+            "cron": self.cron, "next_run": self.next_run, "created_by": self.created_by,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["id"], data["channel_id"], data["message"], data["timezone"],
+            cron=data.get("cron"), next_run=data.get("next_run"), created_by=data.get("created_by"),
+        )
+
+
+class AnnouncementScheduler:
+    """Heap of upcoming jobs; sleeps until the earliest one is due and persists jobs to disk."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.jobs = {}  # job id -> ScheduledJob
+        self.heap = []  # (next_run, job id); stale entries are skipped when popped
+        self.wakeup = None
+        self.task = None
+        self.mtime = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            now = datetime.now(pytz.utc)
+            for cron, message in config.default_scheduled_jobs:
+                job = ScheduledJob(uuid.uuid4().hex[:8], config.scheduled_channel_id, message, config.default_timezone, cron=cron)
+                job.compute_next_run(now)
+                self.jobs[job.id] = job
+            self.save()
+            self.replace_jobs(self.jobs)
+        else:
+            self.replace_jobs(self.read_jobs())
+
+    def read_jobs(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            return {data["id"]: ScheduledJob.from_dict(data) for data in json.load(f)}
+
+    def replace_jobs(self, jobs: dict):
+        heap = [(job.next_run, job.id) for job in jobs.values()]
+        heapq.heapify(heap)
+        self.jobs, self.heap = jobs, heap
+        self.mtime = os.path.getmtime(self.path)
+        if self.wakeup:
+            self.wakeup.set()
+
+    def refresh(self):
+        # Other shard processes may have edited the job file
+        if self.mtime is None or not os.path.exists(self.path) or os.path.getmtime(self.path) != self.mtime:
+            self.load()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([job.to_dict() for job in self.jobs.values()], f, indent=2)
+        os.replace(tmp_path, self.path)
+        self.mtime = os.path.getmtime(self.path)
+
+    def add(self, job: ScheduledJob):
+        self.refresh()
+        self.jobs[job.id] = job
+        heapq.heappush(self.heap, (job.next_run, job.id))
+        self.save()
+        if self.wakeup:
+            self.wakeup.set()
+
+    def remove(self, job_id: str):
+        self.refresh()
+        job = self.jobs.pop(job_id, None)
+        if job:
+            self.save()
+            if self.wakeup:
+                self.wakeup.set()
+        return job
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.load()
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+            print(f"[INFO] Announcement scheduler started with {len(self.jobs)} jobs.")
+
+    def _peek(self):
+        while self.heap:
+            next_run, job_id = self.heap[0]
+            job = self.jobs.get(job_id)
+            if job and job.next_run == next_run:
+                return job
+            heapq.heappop(self.heap)
+        return None
+
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            if SHARDED:
+                self.refresh()
+            job = self._peek()
+            delay = job.next_run - time.time() if job else None
+            if SHARDED and (delay is None or delay > SCHEDULE_RELOAD_INTERVAL):
+                delay = SCHEDULE_RELOAD_INTERVAL
+            if delay is None or delay > 0:
+                await wait_or_timeout(self.wakeup.wait(), delay)
+                continue
+            heapq.heappop(self.heap)
+            try:
+                await self.fire(job)
+            except Exception as e:
+                print(f"[ERROR] Scheduled job {job.id} failed: {e}")
+
+    async def fire(self, job: ScheduledJob):
+        late = time.time() - job.next_run
+        if late > SCHEDULE_CATCHUP_WINDOW:
+            print(f"[WARN] Skipping scheduled job {job.id}, it is {late / 3600:.1f}h overdue.")
+        else:
+            channel = bot.get_channel(job.channel_id) or bot.get_partial_messageable(job.channel_id)
+            try:
+                await channel.send(job.message)
+            except discord.HTTPException as e:
+                print(f"[ERROR] Scheduled job {job.id} could not post to {job.channel_id}: {e}")
+        # Merge with jobs other shard processes wrote while this one was sending, so saving keeps them
+        self.refresh()
+        job = self.jobs.get(job.id)
+        if job is None:
+            return  # removed while the message was being sent
+        if job.cron:
+            # Missed runs collapse into the single catch-up above
+            job.compute_next_run(datetime.now(pytz.utc))
+            heapq.heappush(self.heap, (job.next_run, job.id))
+        else:
+            del self.jobs[job.id]
+        self.save()
+
+
+announcement_scheduler = AnnouncementScheduler(SCHEDULE_FILE)
+
+
+def describe_job(job: ScheduledJob):
+    when = datetime.fromtimestamp(job.next_run, pytz.timezone(job.timezone)).strftime("%Y-%m-%d %H:%M %Z")
+    repeat = f"`{job.cron}`" if job.cron else "once"
+    return f"<#{job.channel_id}> • {repeat} • next {when}\n{job.message[:200]}"
+
+
+async def timezone_autocomplete(interaction: discord.Interaction, current: str):
+    current = current.lower()
+    matches = [tz for tz in pytz.common_timezones if current in tz.lower()][:AUTOCOMPLETE_LIMIT]
+    return [app_commands.Choice(name=tz, value=tz) for tz in matches]
+
+
+# Slash command: Schedule a recurring announcement
+@bot.tree.command(name="schedule_add", description="Schedule a recurring announcement with a cron expression.")
+@role_required()
+@app_commands.describe(
+    channel="Channel to post the announcement in",
+    message="The message to send",
+    cron="Cron expression: minute hour day month weekday (e.g. 5 8 * * *)",
+    timezone="Timezone the cron expression is evaluated in"
+)
+@app_commands.autocomplete(timezone=timezone_autocomplete)
+async def schedule_add(interaction: discord.Interaction, channel: discord.TextChannel, message: str, cron: str, timezone: str = None):
+    timezone = timezone or config.default_timezone
+    if timezone not in pytz.all_timezones_set:
+        await interaction.response.send_message(f"Unknown timezone `{timezone}`.", ephemeral=True)
+        return
+    job = ScheduledJob(uuid.uuid4().hex[:8], channel.id, message, timezone, cron=cron, created_by=interaction.user.id)
+    try:
+        job.compute_next_run(datetime.now(pytz.utc))
+    except ValueError as e:
+        await interaction.response.send_message(f"Invalid cron expression: {e}", ephemeral=True)
+        return
+    announcement_scheduler.add(job)
+    await interaction.response.send_message(f"Scheduled job `{job.id}`: {describe_job(job)}", ephemeral=True)
+
+
+# Slash command: Schedule a one-off announcement
+@bot.tree.command(name="schedule_once", description="Schedule a one-off announcement.")
+@role_required()
+@app_commands.describe(
+    channel="Channel to post the announcement in",
+    message="The message to send",
+    when="Date and time as YYYY-MM-DD HH:MM",
+    timezone="Timezone of the given time"
+)
+@app_commands.autocomplete(timezone=timezone_autocomplete)
+async def schedule_once(interaction: discord.Interaction, channel: discord.TextChannel, message: str, when: str, timezone: str = None):
+    timezone = timezone or config.default_timezone
+    if timezone not in pytz.all_timezones_set:
+        await interaction.response.send_message(f"Unknown timezone `{timezone}`.", ephemeral=True)
+        return
+    try:
+        run_at = pytz.timezone(timezone).localize(datetime.strptime(when.strip(), "%Y-%m-%d %H:%M"))
+    except ValueError:
+        await interaction.response.send_message("Invalid time. Use the format YYYY-MM-DD HH:MM.", ephemeral=True)
+        return
+    if run_at.timestamp() <= time.time():
+        await interaction.response.send_message("That time is already in the past.", ephemeral=True)
+        return
+    job = ScheduledJob(uuid.uuid4().hex[:8], channel.id, message, timezone, next_run=run_at.timestamp(), created_by=interaction.user.id)
+    announcement_scheduler.add(job)
+    await interaction.response.send_message(f"Scheduled job `{job.id}`: {describe_job(job)}", ephemeral=True)
+
+
+# Slash command: List scheduled announcements
+@bot.tree.command(name="schedule_list", description="List scheduled announcements.")
+@role_required()
+async def schedule_list(interaction: discord.Interaction):
+    announcement_scheduler.refresh()
+    jobs = sorted(announcement_scheduler.jobs.values(), key=lambda job: job.next_run)
+    embed = discord.Embed(title="Scheduled Announcements", color=0x3498db)
+    for job in jobs[:25]:
+        embed.add_field(name=f"Job {job.id}", value=describe_job(job), inline=False)
+    if not jobs:
+        embed.description = "Nothing is scheduled."
+    elif len(jobs) > 25:
+        embed.set_footer(text=f"Showing the next 25 of {len(jobs)} jobs")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+# Slash command: Remove a scheduled announcement
+@bot.tree.command(name="schedule_remove", description="Remove a scheduled announcement.")
+@role_required()
+@app_commands.describe(job_id="ID of the job from /schedule_list")
+async def schedule_remove(interaction: discord.Interaction, job_id: str):
+    job = announcement_scheduler.remove(job_id.strip())
+    if job:
+        await interaction.response.send_message(f"Removed job `{job.id}`.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"No scheduled job with ID `{job_id}`.", ephemeral=True)
+            
+            
+            
+# --- Member name index ---
+AUTOCOMPLETE_LIMIT = 25  # Discord accepts at most 25 autocomplete choices
+MEMBER_LRU_SIZE = 512  # members fetched on demand when the library cache is off
+MEMBER_QUERY_BATCH = 100  # gateway member queries accept at most 100 user ids
+# Estimate for /systeminfo: benchmark.py's member_cache_bytes measured one discord.py 2.7.1 Member with
+# its User and two roles at 573 bytes under tracemalloc; re-measure there when upgrading the library
+FULL_MEMBER_BYTES = 573
+
+
+class MemberRecord:
+    """The few member fields the bot relies on, small enough to keep for every member."""
+
+    __slots__ = ("id", "name", "global_name", "bot", "joined_at", "role_ids")
+
+    def __init__(self, member_id, name, global_name, bot, joined_at, role_ids):
+        self.id = member_id
+        self.name = name
+        self.global_name = global_name
+        self.bot = bot
+        self.joined_at = joined_at  # unix timestamp or None
+        self.role_ids = array("Q", sorted(role_ids))
+
+    @classmethod
+    def from_member(cls, member: discord.Member):
+        return cls(
+            member.id, member.name, member.global_name, member.bot,
+            member.joined_at.timestamp() if member.joined_at else None,
+            (role.id for role in member.roles if not role.is_default()),
+        )
+
+    @classmethod
+    def from_payload(cls, data: dict):
+        user = data["user"]
+        joined_at = discord.utils.parse_time(data.get("joined_at"))
+        return cls(
+            int(user["id"]), user["username"], user.get("global_name"), user.get("bot", False),
+            joined_at.timestamp() if joined_at else None,
+            (int(role_id) for role_id in data.get("roles", ())),
+        )
+
+    def has_role(self, role_id: int):
+        i = bisect.bisect_left(self.role_ids, role_id)
+        return i < len(self.role_ids) and self.role_ids[i] == role_id
+
+    def top_role(self, guild: discord.Guild):
+        roles = [role for role in map(guild.get_role, self.role_ids) if role is not None]
+        return max(roles, default=guild.default_role)
+
+
+class MemberIndex:
+    """Per-guild member records, kept in sync from gateway events.
+
+    Non-bot names are held in a sorted list for prefix/substring autocomplete and in
+    hash maps so exact usernames and global names resolve in constant time.
+    """
+
+    def __init__(self):
+        self.records = {}  # member id -> MemberRecord
+        self.sorted_names = []  # sorted (lowercase name, member id), non-bots only
+        self.by_name = {}  # lowercase name -> set of member ids
+        self.by_global_name = {}  # lowercase global name -> set of member ids
+        self.trigrams = {}  # three-letter slice of a lowercase name -> set of member ids
+
+    def extend(self, records):
+        """Index a batch of new records while building. Each batch lands as a sorted run so finish() only merges runs."""
+        names = []
+        for record in records:
+            self.records[record.id] = record
+            if record.bot:
+                continue
+            names.append((record.name.lower(), record.id))
+            self._index_names(record)
+        names.sort()
+        self.sorted_names.extend(names)
+
+    def finish(self):
+        self.sorted_names.sort()
+
+    def add_record(self, record: MemberRecord):
+        old = self.records.get(record.id)
+        if old and (old.name, old.global_name, old.bot) == (record.name, record.global_name, record.bot):
+            self.records[record.id] = record  # only roles changed, the name indexes stay valid
+            return
+        self.remove(record.id)
+        self.records[record.id] = record
+        if record.bot:
+            return
+        bisect.insort(self.sorted_names, (record.name.lower(), record.id))
+        self._index_names(record)
+
+    def _index_names(self, record: MemberRecord):
+        name = record.name.lower()
+        self.by_name.setdefault(name, set()).add(record.id)
+        if record.global_name:
+            self.by_global_name.setdefault(record.global_name.lower(), set()).add(record.id)
+        for trigram in _trigrams(name):
+            self.trigrams.setdefault(trigram, set()).add(record.id)
+
+    def remove(self, member_id: int):
+        record = self.records.pop(member_id, None)
+        if record is None or record.bot:
+            return
+        key = (record.name.lower(), member_id)
+        i = bisect.bisect_left(self.sorted_names, key)
+        if i < len(self.sorted_names) and self.sorted_names[i] == key:
+            del self.sorted_names[i]
+        _discard_id(self.by_name, record.name.lower(), member_id)
+        if record.global_name:
+            _discard_id(self.by_global_name, record.global_name.lower(), member_id)
+        for trigram in _trigrams(record.name.lower()):
+            _discard_id(self.trigrams, trigram, member_id)
+
+    def lookup(self, text: str):
+        """Return the set of member ids whose username, or failing that global name, is exactly `text`."""
+        key = text.lower()
+        return self.by_name.get(key) or self.by_global_name.get(key) or set()
+
+    def search(self, query: str, limit: int = AUTOCOMPLETE_LIMIT):
+        """Return up to `limit` (member id, name) pairs, prefix matches first, then substring matches.
+
+        Substring matches come from the trigram index, so only queries of three or more
+        characters get them; shorter queries are answered from the prefix range alone.
+        """
+        query = query.lower()
+        results = []
+        seen = set()
+        i = bisect.bisect_left(self.sorted_names, (query,))
+        while i < len(self.sorted_names) and len(results) < limit:
+            key, member_id = self.sorted_names[i]
+            if not key.startswith(query):
+                break
+            results.append((member_id, self.records[member_id].name))
+            seen.add(member_id)
+            i += 1
+        if len(query) >= 3 and len(results) < limit:
+            sets = sorted((self.trigrams.get(trigram, ()) for trigram in _trigrams(query)), key=len)
+            candidates = set(sets[0]).intersection(*sets[1:]) - seen
+            matches = sorted(
+                (self.records[member_id].name.lower(), member_id) for member_id in candidates
+                if query in self.records[member_id].name.lower()
+            )
+            for key, member_id in matches[:limit - len(results)]:
+                results.append((member_id, self.records[member_id].name))
+        return results
+
+    def memory_usage(self):
+        """Approximate bytes held by the records and name indexes."""
+        size = sys.getsizeof(self.records) + sys.getsizeof(self.sorted_names)
+        for record in self.records.values():
+            size += sys.getsizeof(record) + sys.getsizeof(record.role_ids) + sys.getsizeof(record.name)
+            if record.global_name:
+                size += sys.getsizeof(record.global_name)
+        for ids in self.trigrams.values():
+            size += sys.getsizeof(ids)
+        return size + sys.getsizeof(self.by_name) + sys.getsizeof(self.by_global_name) + 64 * len(self.sorted_names)
+
+
+def _trigrams(name: str):
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+
+def _discard_id(mapping: dict, key: str, member_id: int):
+    ids = mapping.get(key)
+    if ids:
+        ids.discard(member_id)
+        if not ids:
+            del mapping[key]
+
+
+MEMBER_INDEX_SLICE = 1000  # members indexed per event loop turn while an index is built
+
+member_indexes = {}  # guild id -> MemberIndex
+member_index_builds = {}  # guild id -> task building that guild's index
+member_index_changes = {}  # guild id -> [(member id, MemberRecord or None)] seen while its index is being built
+member_lru = OrderedDict()  # (guild id, member id) -> Member fetched on demand
+
+
+async def build_member_index(guild: discord.Guild):
+    """Build and install a guild's index a slice of members at a time so the gateway keeps being served."""
+    changes = member_index_changes[guild.id] = []
+    try:
+        if LEAN_MEMBER_CACHE:
+            # With the library cache off the index is filled from a non-caching chunk request instead
+            try:
+                members = await guild.chunk(cache=False)
+            except (asyncio.TimeoutError, discord.ClientException) as e:
+                print(f"[ERROR] Could not load the members of {guild.name}: {e}")
+                return None
+        else:
+            members = list(guild.members)
+        index = MemberIndex()
+        for start in range(0, len(members), MEMBER_INDEX_SLICE):
+            index.extend(MemberRecord.from_member(member) for member in members[start:start + MEMBER_INDEX_SLICE])
+            # The index lives as long as the bot; keeping it out of the collector's generations stops a full
+            # collection from rescanning every set built so far, which stalled the loop for hundreds of ms.
+            gc.freeze()
+            await asyncio.sleep(0)
+        index.finish()
+        # Joins, leaves and updates that arrived while the slices were indexed
+        for member_id, record in changes:
+            if record:
+                index.add_record(record)
+            else:
+                index.remove(member_id)
+        member_indexes[guild.id] = index
+        return index
+    finally:
+        member_index_changes.pop(guild.id, None)
+
+
+def index_guild_members(guild: discord.Guild):
+    """Start building a guild's index in the background unless a build is already running. Returns the task."""
+    task = member_index_builds.get(guild.id)
+    if task is None or task.done():
+        task = member_index_builds[guild.id] = asyncio.create_task(build_member_index(guild))
+    return task
+
+
+async def get_member_index(guild: discord.Guild) -> MemberIndex:
+    """Return the guild's index, waiting for a build first if there is none yet."""
+    index = member_indexes.get(guild.id)
+    if index is None:
+        index = await index_guild_members(guild)
+    return index or MemberIndex()
+
+
+def apply_member_change(guild_id: int, member_id: int, record: MemberRecord = None):
+    """Apply a join or update (a record) or a leave (None) to the guild's index and to a build in progress."""
+    changes = member_index_changes.get(guild_id)
+    if changes is not None:
+        changes.append((member_id, record))
+    index = member_indexes.get(guild_id)
+    if index:
+        if record:
+            index.add_record(record)
+        else:
+            index.remove(member_id)
+
+
+async def populate_member_index(guild: discord.Guild):
+    index = await index_guild_members(guild)
+    if index:
+        print(f"[INFO] Indexed {len(index.records)} members of {guild.name}.")
+
+
+guild_chunk_tasks = {}  # guild id -> task filling the member cache for a guild skipped at startup
+
+
+def ensure_guild_chunked(guild: discord.Guild):
+    """Start chunking a guild that was not chunked at startup. Returns the task, or None if nothing is pending."""
+    if LEAN_MEMBER_CACHE or guild.chunked:
+        return None
+    task = guild_chunk_tasks.get(guild.id)
+    if task is None:
+        task = guild_chunk_tasks[guild.id] = asyncio.create_task(chunk_guild(guild))
+    return task
+
+
+async def chunk_guild(guild: discord.Guild):
+    started = time.perf_counter()
+    try:
+        await guild.chunk()
+    except (asyncio.TimeoutError, discord.ClientException) as e:
+        print(f"[ERROR] Could not chunk {guild.name}: {e}")
+        return
+    finally:
+        guild_chunk_tasks.pop(guild.id, None)
+    pending = member_index_builds.get(guild.id)
+    if pending:
+        # A build started from the partial cache; the rebuild below replaces it
+        await asyncio.wait({pending})
+    await index_guild_members(guild)
+    print(f"[INFO] Chunked {guild.member_count} members of {guild.name} in {time.perf_counter() - started:.1f}s.")
+
+
+background_chunking = None
+
+
+async def chunk_guilds_in_background():
+    started = time.perf_counter()
+    for guild in list(bot.guilds):
+        task = ensure_guild_chunked(guild)
+        if task:
+            await task
+    if config.profile_startup:
+        print(f"[INFO] Background member chunking finished in {time.perf_counter() - started:.2f}s.")
+
+
+def forget_cached_member(guild_id: int, member_id: int):
+    member_lru.pop((guild_id, member_id), None)
+
+
+async def get_members(guild: discord.Guild, member_ids):
+    """Return {id: Member} from the library cache, the LRU or a gateway member query."""
+    found = {}
+    missing = []
+    for member_id in member_ids:
+        member = guild.get_member(member_id)
+        if member is None and (guild.id, member_id) in member_lru:
+            member = member_lru[(guild.id, member_id)]
+            member_lru.move_to_end((guild.id, member_id))
+        if member:
+            found[member_id] = member
+        else:
+            missing.append(member_id)
+    for i in range(0, len(missing), MEMBER_QUERY_BATCH):
+        try:
+            members = await guild.query_members(user_ids=missing[i:i + MEMBER_QUERY_BATCH], cache=False)
+        except asyncio.TimeoutError:
+            continue
+        for member in members:
+            found[member.id] = member
+            member_lru[(guild.id, member.id)] = member
+            if len(member_lru) > MEMBER_LRU_SIZE:
+                member_lru.popitem(last=False)
+    return found
+
+
+def member_autocomplete(interaction: discord.Interaction, current: str):
+    # Suggestions fill in once a lazily chunked guild finishes loading and its index is built
+    ensure_guild_chunked(interaction.guild)
+    index = member_indexes.get(interaction.guild.id)
+    if index is None:
+        index_guild_members(interaction.guild)
+        return []
+    return [app_commands.Choice(name=name, value=str(member_id)) for member_id, name in index.search(current)]
+
+
+MEMBER_REFERENCE = re.compile(r"<@!?(\d+)>|(\d{15,20})")
+
+
+async def resolve_member_id(guild: discord.Guild, text: str, interaction: discord.Interaction = None):
+    """Resolve a member ID, mention, username or global name. Returns (member id, error message).
+
+    Names are only looked up once the guild is chunked; the interaction, if given, is deferred while it loads.
+    """
+    text = text.strip()
+    match = MEMBER_REFERENCE.fullmatch(text)
+    if match:
+        return int(match.group(1) or match.group(2)), None
+    chunking = ensure_guild_chunked(guild)
+    if chunking:
+        if interaction and not interaction.response.is_done():
+            await interaction.response.defer(ephemeral=True, thinking=True)
+        await chunking
+    member_ids = (await get_member_index(guild)).lookup(text.lstrip("@"))
+    if len(member_ids) > 1:
+        return None, f"More than one member matches **{text}**. Pick one from the suggestions or use their ID."
+    if member_ids:
+        return next(iter(member_ids)), None
+    return None, f"User **{text}** not found in the server."
+
+
+async def resolve_member(guild: discord.Guild, text: str, interaction: discord.Interaction = None):
+    """Resolve a member ID, mention, username or global name. Returns (member, error message)."""
+    member_id, error = await resolve_member_id(guild, text, interaction)
+    if member_id is None:
+        return None, error
+    member = (await get_members(guild, [member_id])).get(member_id)
+    if member is None:
+        return None, f"User **{text.strip()}** not found in the server."
+    return member, None
+
+
+@bot.listen("on_member_join")
+async def index_member_join(member: discord.Member):
+    apply_member_change(member.guild.id, member.id, MemberRecord.from_member(member))
+
+
+@bot.listen("on_raw_member_remove")
+async def index_member_remove(payload: discord.RawMemberRemoveEvent):
+    forget_cached_member(payload.guild_id, payload.user.id)
+    apply_member_change(payload.guild_id, payload.user.id)
+
+
+@bot.listen("on_member_update")
+async def index_member_update(before: discord.Member, after: discord.Member):
+    if before.name != after.name or before.global_name != after.global_name or before.roles != after.roles:
+        apply_member_change(after.guild.id, after.id, MemberRecord.from_member(after))
+
+
+@bot.listen("on_user_update")
+async def index_user_update(before: discord.User, after: discord.User):
+    if before.name == after.name and before.global_name == after.global_name:
+        return
+    for guild in after.mutual_guilds:
+        member = guild.get_member(after.id)
+        if member:
+            apply_member_change(guild.id, member.id, MemberRecord.from_member(member))
+
+
+@bot.listen("on_guild_remove")
+async def index_guild_remove(guild: discord.Guild):
+    member_indexes.pop(guild.id, None)
+
+
+def install_lean_member_updates():
+    # Without a member cache discord.py drops GUILD_MEMBER_UPDATE before dispatching it,
+    # so the compact records are updated straight from the gateway payload. The parser
+    # table is private to discord.py; it has kept this shape throughout 2.x, and other
+    # versions are left alone rather than patched blindly.
+    parsers = getattr(bot._connection, "parsers", None)
+    if discord.version_info.major != 2 or not isinstance(parsers, dict) or "GUILD_MEMBER_UPDATE" not in parsers:
+        print(f"[WARN] discord.py {discord.__version__} is not supported by lean member updates; name and role changes will not reach the member index.")
+        return
+    parse_member_update = parsers["GUILD_MEMBER_UPDATE"]
+
+    def parse(data):
+        parse_member_update(data)
+        guild_id = int(data["guild_id"])
+        forget_cached_member(guild_id, int(data["user"]["id"]))
+        apply_member_change(guild_id, int(data["user"]["id"]), MemberRecord.from_payload(data))
+
+    parsers["GUILD_MEMBER_UPDATE"] = parse
+
+
+if not LEAN_MEMBER_CACHE and config.member_chunking == "background":
+    @bot.listen("on_guild_join")
+    async def chunk_joined_guild(guild: discord.Guild):
+        ensure_guild_chunked(guild)
+
+
+if LEAN_MEMBER_CACHE:
+    install_lean_member_updates()
+
+    @bot.listen("on_guild_available")
+    async def index_guild_available(guild: discord.Guild):
+        await populate_member_index(guild)
+
+    @bot.listen("on_guild_join")
+    async def index_guild_join(guild: discord.Guild):
+        await populate_member_index(guild)
+else:
+    # Guilds chunked at startup are indexed as soon as they are available, not on the first keystroke;
+    # lazily chunked guilds are indexed by chunk_guild
+    @bot.listen("on_guild_available")
+    async def index_guild_available(guild: discord.Guild):
+        if guild.chunked:
+            index_guild_members(guild)
+
+    @bot.listen("on_guild_join")
+    async def index_guild_join(guild: discord.Guild):
+        if guild.chunked:
+            index_guild_members(guild)
+
+
+# --- Batched log channel sink ---
+LOG_BATCH_SIZE = 10  # Discord allows up to 10 embeds per message
+LOG_FLUSH_WINDOW = 2.0  # seconds to wait for more entries before posting a partial batch
+LOG_MAX_BACKOFF = 60.0
+
+
+class LogSink:
+    """Coalesces log embeds for one channel and posts them in the background."""
+
+    def __init__(self, channel_id: int):
+        self.channel_id = channel_id
+        self.queue = None
+        self.task = None
+
+    def post(self, embed: discord.Embed, content: str = None):
+        if self.queue is None:
+            self.queue = asyncio.Queue()
+        self.queue.put_nowait((content, embed))
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + LOG_FLUSH_WINDOW
+            while len(batch) < LOG_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                entry = await wait_or_timeout(self.queue.get(), remaining)
+                if entry is None:
+                    break
+                batch.append(entry)
+            await self.flush(batch)
+
+    async def flush(self, batch):
+        channel = bot.get_channel(self.channel_id)
+        if channel is None:
+            print(f"[ERROR] Logging channel {self.channel_id} not found, dropped {len(batch)} log entries.")
+            return
+        content = " ".join(content for content, _ in batch if content) or None
+        embeds = [embed for _, embed in batch]
+        backoff = 1.0
+        while True:
+            try:
+                await channel.send(content=content, embeds=embeds)
+                return
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    print(f"[ERROR] Could not post {len(batch)} log entries: {e}")
+                    return
+                headers = getattr(e.response, "headers", None) or {}
+                await asyncio.sleep(float(headers.get("Retry-After", backoff)))
+                backoff = min(backoff * 2, LOG_MAX_BACKOFF)
+
+
+log_sink = LogSink(config.logging_channel_id)
+
+
+# --- Anti-raid join detector ---
+RAID_SUSPICION_SCORE = 2  # features a joiner needs to be treated as part of a raid
+RAID_NAME_KEY = re.compile(r"[\d\W_]+")
+RAID_MIN_NAME_KEY = 3  # shorter name skeletons match too many unrelated names
+raid_queue = ActionQueue()
+
+
+class JoinWindow:
+    """Joins of one guild within a sliding window, with running counts so each join costs O(1)."""
+
+    def __init__(self, guild_id: int):
+        self.guild_id = guild_id
+        self.joins = deque()  # (time, member, name key, features)
+        self.suspicious = 0
+        self.name_keys = {}  # name key -> joins in the window sharing it
+        self.raid_started = None
+        self.raid_joins = 0
+        self.raid_timeouts = 0
+        self.pending_timeouts = []
+        self.timeout_task = None
+        self.watch_task = None
+
+    def expire(self, now: float):
+        cutoff = now - config.raid_window_seconds
+        while self.joins and self.joins[0][0] < cutoff:
+            _, _, key, features = self.joins.popleft()
+            self.suspicious -= len(features) >= RAID_SUSPICION_SCORE
+            if key:
+                remaining = self.name_keys[key] - 1
+                if remaining:
+                    self.name_keys[key] = remaining
+                else:
+                    del self.name_keys[key]
+
+    def add(self, member: discord.Member, now: float):
+        """Record a join and return its suspicion features."""
+        self.expire(now)
+        key = RAID_NAME_KEY.sub("", member.name.lower())
+        key = key if len(key) >= RAID_MIN_NAME_KEY else None
+        features = []
+        if (now - member.created_at.timestamp()) < config.raid_account_age_days * 86400:
+            features.append("new account")
+        if member.avatar is None:
+            features.append("default avatar")
+        if key and key in self.name_keys:
+            features.append("similar name")
+        suspicious = len(features) >= RAID_SUSPICION_SCORE
+        self.joins.append((now, member, key, features))
+        self.suspicious += suspicious
+        if key:
+            self.name_keys[key] = self.name_keys.get(key, 0) + 1
+        return features, suspicious
+
+    def queue_timeout(self, member: discord.Member):
+        self.pending_timeouts.append(member)
+        if self.timeout_task is None or self.timeout_task.done():
+            self.timeout_task = asyncio.create_task(self.apply_timeouts())
+
+    async def apply_timeouts(self):
+        # Joins keep arriving while a batch runs; they are picked up by the next pass
+        while self.pending_timeouts:
+            batch, self.pending_timeouts = self.pending_timeouts, []
+            until = discord.utils.utcnow() + timedelta(minutes=config.raid_timeout_minutes)
+            reason = "Anti-raid: suspicious join during a join flood"
+            jobs = [
+                (f"timeout:{self.guild_id}", member.mention, functools.partial(member.timeout, until, reason=reason))
+                for member in batch
+            ]
+            for member, (label, error) in zip(batch, await raid_queue.run(jobs)):
+                if error is None:
+                    self.raid_timeouts += 1
+                    audit_store.record(self.guild_id, "timeout", member, bot.user, reason)
+                    await expiry_scheduler.add(self.guild_id, "timeout", member.id, until.timestamp(), reason=reason)
+                else:
+                    print(f"[WARN] Anti-raid timeout for {label} failed: {error}")
 
-# Slash command: Timeout
-@bot.tree.command(name="timeout", description="Put a member in timeout.")
-@role_required()
-@app_commands.describe(member="The member to timeout", duration="Timeout duration in seconds")
-async def timeout(interaction: discord.Interaction, member: discord.Member, duration: int):
-    if interaction.user.guild_permissions.moderate_members:
-        await member.edit(timeout_until=discord.utils.utcnow() + discord.timedelta(seconds=duration))
+    async def watch_raid(self, guild_name: str):
+        # Joins may simply stop, so the end of a raid is checked on a timer rather than on the next join
+        while True:
+            await asyncio.sleep(config.raid_window_seconds)
+            self.expire(time.time())
+            if len(self.joins) < config.raid_join_threshold / 2:
+                break
+        duration = time.time() - self.raid_started
         embed = discord.Embed(
-            title="Member Timed Out",
-            description=f"{member.mention} is in timeout for {duration} seconds.",
-            color=0xffff00
+            title="Join Flood Ended",
+            description=f"**{guild_name}**: {self.raid_joins} joins over {duration / 60:.0f} minutes, {self.raid_timeouts} timed out.",
+            color=0x00ff00
         )
-        embed.set_footer(text=f"Actioned by {interaction.user}")
-        await interaction.response.send_message(embed=embed)
-    else:
-        await interaction.response.send_message("You don't have permission to moderate members.", ephemeral=True)
+        log_sink.post(embed)
+        self.raid_started = None
 
-# Slash command: Custom Message
-@bot.tree.command(name="announce", description="Create a custom announcement.")
-@role_required()
-@app_commands.describe(
-    title="The title of the announcement",
-    description="The description of the announcement",
-    color="The color of the embed (hex format, e.g., #ff0000)",
-    image_url="The image URL for the embed"
-)
-async def announce(interaction: discord.Interaction, title: str, description: str, color: str = None, image_url: str = None):
-    color = int(color.lstrip('#'), 16) if color else 0x00ff00 
-    embed = discord.Embed(title=title, description=description, color=color)
-    embed.set_footer(text=f"Announced by {interaction.user}")
-    if image_url:
-        embed.set_image(url=image_url)
-    await interaction.response.send_message(embed=embed)
 
-# Slash command: Poll
-@bot.tree.command(name="poll", description="Create a poll with multiple options.")
-@role_required()
-@app_commands.describe(question="The poll question", options="Comma-separated list of options")
-async def poll(interaction: discord.Interaction, question: str, options: str):
-    options_list = options.split(',')
-    if len(options_list) < 2:
-        await interaction.response.send_message("Please provide at least two options.", ephemeral=True)
-        return
+join_windows = {}  # guild id -> JoinWindow
 
-    embed = discord.Embed(title="Poll", description=question, color=0x3498db)
-    reactions = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣'][:len(options_list)]
-    for idx, option in enumerate(options_list):
-        embed.add_field(name=f"{reactions[idx]} Option", value=option.strip(), inline=False)
-    message = await interaction.channel.send(embed=embed)
-    for reaction in reactions:
-        await message.add_reaction(reaction)
 
-    await interaction.response.send_message("Poll created!", ephemeral=True)
+def raid_alert_embed(guild: discord.Guild, window: JoinWindow):
+    embed = discord.Embed(
+        title="Join Flood Detected 🚨",
+        description=(
+            f"**{guild.name}**: {len(window.joins)} joins in the last {config.raid_window_seconds}s, "
+            f"{window.suspicious} of them suspicious."
+        ),
+        color=0xff0000
+    )
+    recent = [
+        f"{member.mention} ({', '.join(features)})"
+        for _, member, _, features in reversed(window.joins) if len(features) >= RAID_SUSPICION_SCORE
+    ][:10]
+    if recent:
+        embed.add_field(name="Recent suspicious joins", value="\n".join(recent)[:1024], inline=False)
+    action = f"timing out suspicious joiners for {config.raid_timeout_minutes} minutes" if config.raid_timeout_minutes > 0 else "alert only"
+    embed.add_field(name="Action", value=action, inline=False)
+    return embed
 
-# Slash command: Set Activity
-@bot.tree.command(name="setactivity", description="Set a custom bot activity.")
-@role_required()
-@app_commands.describe(
-    activity_type="Type of activity (playing, watching, listening)",
-    description="The description of the activity"
-)
-async def setactivity(interaction: discord.Interaction, activity_type: str, description: str):
-    activity_type = activity_type.lower()
-    if activity_type == "playing":
-        activity = discord.Game(name=description)
-    elif activity_type == "watching":
-        activity = discord.Activity(type=discord.ActivityType.watching, name=description)
-    elif activity_type == "listening":
-        activity = discord.Activity(type=discord.ActivityType.listening, name=description)
-    else:
-        await interaction.response.send_message("Invalid activity type. Choose from: playing, watching, listening, competing.", ephemeral=True)
+
+@bot.listen("on_member_join")
+async def detect_join_flood(member: discord.Member):
+    if not config.raid_detection or member.bot:
         return
+    window = join_windows.get(member.guild.id)
+    if window is None:
+        window = join_windows[member.guild.id] = JoinWindow(member.guild.id)
+    now = time.time()
+    features, suspicious = window.add(member, now)
+    if window.raid_started is None:
+        if len(window.joins) < config.raid_join_threshold:
+            return
+        window.raid_started = now
+        window.raid_joins = len(window.joins)
+        window.raid_timeouts = 0
+        log_sink.post(raid_alert_embed(member.guild, window))
+        window.watch_task = asyncio.create_task(window.watch_raid(member.guild.name))
+        if config.raid_timeout_minutes > 0:
+            # Suspicious members who joined before the threshold was crossed are part of the flood too
+            for _, earlier, _, earlier_features in window.joins:
+                if len(earlier_features) >= RAID_SUSPICION_SCORE:
+                    window.queue_timeout(earlier)
+        return
+    window.raid_joins += 1
+    if suspicious and config.raid_timeout_minutes > 0:
+        window.queue_timeout(member)
 
-    await bot.change_presence(activity=activity)
-    await interaction.response.send_message(f"Bot activity set to: {activity_type.capitalize()} {description}", ephemeral=True)
 
-# Slash command: Help
-@bot.tree.command(name="help", description="Show all available commands and their descriptions.")
-@role_required()
-async def help_command(interaction: discord.Interaction):
+def whitelist_approved_embed(member: discord.Member, actor: discord.Member):
     embed = discord.Embed(
-        title="Help - List of Commands",
-        description="Here are all the available commands in the bot:",
-        color=0x00ff00
+        title="Whitelist Approved ✅",
+        description=f"Congratulations **{member.mention}** has been approved for the whitelist.",
+        color=discord.Color.green()
     )
-    for command in bot.tree.get_commands():
-        embed.add_field(name=f"/{command.name}", value=command.description, inline=False)
-    embed.set_footer(text=f"Requested by {interaction.user}")
-    await interaction.response.send_message(embed=embed)
+    embed.set_footer(text=f"Approved by {actor.display_name}")
+    embed.set_image(url=config.approval_image_url)
+    return embed
 
 
-# Slash command: Check Ping
-@bot.tree.command(name="ping", description="Check the bot's latency.")
-@role_required()
-async def ping(interaction: discord.Interaction):
-    latency = round(bot.latency * 1000) 
-    embed = discord.Embed(
-        title="Pong! 🏓",
-        description=f"The bot's latency is `{latency}ms`.",
-        color=0x00ff00
-    )
-    await interaction.response.send_message(embed=embed)
-    
-    
-# Slash command: System Info
-@bot.tree.command(name="systeminfo", description="Check the bot's hosting system information.")
-@role_required()
-async def systeminfo(interaction: discord.Interaction):
-    # Get system information
-    process = psutil.Process(os.getpid())
-    cpu_usage = psutil.cpu_percent(interval=1)
-    memory_info = psutil.virtual_memory()
-    memory_used = memory_info.used / (1024 ** 2)  # Convert bytes to MB
-    memory_total = memory_info.total / (1024 ** 2)  # Convert bytes to MB
-    memory_percent = memory_info.percent
-    uptime_seconds = int(process.create_time())
-    uptime = datetime.now() - datetime.fromtimestamp(uptime_seconds)
-
-    # Create an embed
+def whitelist_rejected_embed(member: discord.Member, actor: discord.Member):
     embed = discord.Embed(
-        title="Bot Hosting System Information",
-        color=0x3498db
+        title="Whitelist Rejected ❌",
+        description=f"Sorry! **{member.mention}** has been rejected from the whitelist.",
+        color=discord.Color.red()
     )
-    embed.add_field(name="CPU Usage", value=f"{cpu_usage}%", inline=False)
-    embed.add_field(name="Memory Usage", value=f"{memory_used:.2f} MB / {memory_total:.2f} MB ({memory_percent}%)", inline=False)
-    embed.add_field(name="Bot Uptime", value=str(uptime).split('.')[0], inline=False)
-    embed.add_field(name="Platform", value=os.name, inline=False)
-    embed.add_field(name="Python Version", value=os.sys.version.split(" ")[0], inline=False)
-    embed.set_footer(text=f"Requested by {interaction.user}")
-
-    # Send the embed
-    await interaction.response.send_message(embed=embed)
-    
-# Timezone for IST
-ist = pytz.timezone("Asia/Kolkata")
-
-
-SCHEDULED_CHANNEL_ID = 1315896892156018769 
-
-def get_ist_time():
-    return datetime.now(ist)
+    embed.set_footer(text=f"Rejected by {actor.display_name}")
+    embed.set_image(url=config.rejection_image_url)
+    return embed
 
 
-@tasks.loop(seconds=60)  # Runs every minute
-async def scheduled_task():
-    now = get_ist_time()
-    print(f"[DEBUG] Current IST Time: {now.strftime('%Y-%m-%d %H:%M:%S')}")  # Debugging log
-    if now.hour == 8 and now.minute == 5:
-        channel = bot.get_channel(SCHEDULED_CHANNEL_ID)
-        if channel:
-            await channel.send("Test Morning 8:05")
-        else:
-            print("[ERROR] Scheduled channel not found or bot has no access.")
-    elif now.hour == 20 and now.minute == 5:
-        channel = bot.get_channel(SCHEDULED_CHANNEL_ID)
-        if channel:
-            await channel.send("test msg.")
-        else:
-            print("[ERROR] Scheduled channel not found or bot has no access.")
-            
-            
-            
 # --- Whitelist Approved Command ---
 @bot.tree.command(name="whitelist_approved", description="Approve a user for the whitelist.")
-@role_required()
+@role_required("whitelist")
 @app_commands.describe(user="The user to approve for the whitelist.")
 async def whitelist_approved(interaction: discord.Interaction, user: str):
     guild = interaction.guild
-    member = discord.utils.get(guild.members, name=user)
+    member, error = await resolve_member(guild, user, interaction)
+    # resolve_member may have deferred while the guild's members were loading
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
 
     if member:
-        role = guild.get_role(WHITELIST_ROLE_ID)
+        role = guild.get_role(config.whitelist_role_id)
         if role:
             await member.add_roles(role)
-            embed = discord.Embed(
-                title="Whitelist Approved ✅",
-                description=f"Congratulations **{member.mention}** has been approved for the whitelist.",
-                color=discord.Color.green()
-            )
-            embed.set_footer(text=f"Approved by {interaction.user.display_name}")
-            embed.set_image(url=APPROVAL_IMAGE_URL)
-
-            logging_channel = guild.get_channel(LOGGING_CHANNEL_ID)
-            if logging_channel:
-                await logging_channel.send(content=f"{member.mention}", embed=embed)
-            await interaction.response.send_message("Approval logged successfully.", ephemeral=True)
+            embed = whitelist_approved_embed(member, interaction.user)
+            await send("Approval logged successfully.", ephemeral=True)
+            audit_store.record(guild.id, "whitelist_approved", member, interaction.user)
+            log_sink.post(embed, content=member.mention)
         else:
-            await interaction.response.send_message("Whitelist role not found.", ephemeral=True)
+            await send("Whitelist role not found.", ephemeral=True)
     else:
-        await interaction.response.send_message(f"User **{user}** not found in the server.", ephemeral=True)
+        await send(error, ephemeral=True)
 
 # --- Whitelist Rejected Command ---
 @bot.tree.command(name="whitelist_rejected", description="Reject a user from the whitelist.")
-@role_required()
+@role_required("whitelist")
 @app_commands.describe(user="The user to reject from the whitelist.")
 async def whitelist_rejected(interaction: discord.Interaction, user: str):
     guild = interaction.guild
-    member = discord.utils.get(guild.members, name=user)
+    member, error = await resolve_member(guild, user, interaction)
+    send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
 
     if member:
-        embed = discord.Embed(
-            title="Whitelist Rejected ❌",
-            description=f"Sorry! **{member.mention}** has been rejected from the whitelist.",
-            color=discord.Color.red()
-        )
-        embed.set_footer(text=f"Rejected by {interaction.user.display_name}")
-        embed.set_image(url=REJECTION_IMAGE_URL)
-
-        logging_channel = guild.get_channel(LOGGING_CHANNEL_ID)
-        if logging_channel:
-            await logging_channel.send(content=f"{member.mention}", embed=embed)
-        await interaction.response.send_message("Rejection logged successfully.", ephemeral=True)
+        embed = whitelist_rejected_embed(member, interaction.user)
+        await send("Rejection logged successfully.", ephemeral=True)
+        audit_store.record(guild.id, "whitelist_rejected", member, interaction.user)
+        log_sink.post(embed, content=member.mention)
     else:
-        await interaction.response.send_message(f"User **{user}** not found in the server.", ephemeral=True)
+        await send(error, ephemeral=True)
+
+# --- Bulk Whitelist Command ---
+WHITELIST_BULK_LEDGER = "whitelist_bulk_progress.json"
+WHITELIST_BULK_MAX_BYTES = 1024 * 1024
+WHITELIST_DECISIONS = {
+    "approved": True, "approve": True, "accept": True, "yes": True, "y": True,
+    "rejected": False, "reject": False, "deny": False, "no": False, "n": False,
+}
+whitelist_queue = ActionQueue()
+
+
+def load_whitelist_ledger():
+    try:
+        with open(WHITELIST_BULK_LEDGER, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_whitelist_ledger(ledger):
+    tmp_path = f"{WHITELIST_BULK_LEDGER}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(ledger, f)
+    os.replace(tmp_path, WHITELIST_BULK_LEDGER)
+
+
+def parse_whitelist_rows(lines):
+    """Yield (row number, user, decision or None) from CSV or whitespace separated lines."""
+    for row_number, row in enumerate(csv.reader(lines), start=1):
+        cells = [cell.strip() for cell in row if cell.strip()]
+        if len(cells) == 1:
+            cells = cells[0].rsplit(None, 1)
+        if not cells:
+            continue
+        decision = WHITELIST_DECISIONS.get(cells[-1].lower()) if len(cells) > 1 else None
+        if row_number == 1 and decision is None and cells[-1].lower() == "decision":
+            continue  # header row
+        yield row_number, cells[0], decision
+
+
+# Slash command: Bulk Whitelist
+@bot.tree.command(name="whitelist_bulk", description="Approve or reject many whitelist applications from a file.")
+@role_required("whitelist")
+@app_commands.describe(file="CSV or text file with one `user,decision` per line (decision: approved or rejected)")
+async def whitelist_bulk(interaction: discord.Interaction, file: discord.Attachment):
+    if file.size > WHITELIST_BULK_MAX_BYTES:
+        await interaction.response.send_message("That file is too large (limit 1 MB).", ephemeral=True)
+        return
+    guild = interaction.guild
+    role = guild.get_role(config.whitelist_role_id)
+    if role is None:
+        await interaction.response.send_message("Whitelist role not found.", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    data = await file.read()
+    # Rows already applied from this exact file are skipped, so a half-finished batch can simply be re-uploaded
+    batch_key = f"{guild.id}:{hashlib.sha256(data).hexdigest()}"
+    ledger = load_whitelist_ledger()
+    done_rows = ledger.setdefault(batch_key, {})
+
+    results = []  # [row number, user, decision, member id, status]
+    resolved = []  # (result, member id, decision)
+    lines = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", errors="replace", newline="")
+    for row_number, user, decision in parse_whitelist_rows(lines):
+        result = [row_number, user, {True: "approved", False: "rejected"}.get(decision, ""), "", ""]
+        results.append(result)
+        if decision is None:
+            result[4] = "invalid decision"
+        elif str(row_number) in done_rows:
+            result[3], result[4] = done_rows[str(row_number)], "skipped (already processed)"
+        else:
+            member_id, error = await resolve_member_id(guild, user)
+            if member_id is None:
+                result[4] = "ambiguous" if error.startswith("More than one") else "not found"
+            else:
+                result[3] = str(member_id)
+                resolved.append((result, member_id, decision))
+
+    # One lookup for every resolved row, batched into gateway queries for members outside the cache
+    members = await get_members(guild, {member_id for _, member_id, _ in resolved})
+    approvals = []  # (result, member)
+    rejections = []  # (result, member)
+    for result, member_id, decision in resolved:
+        member = members.get(member_id)
+        if member is None:
+            result[4] = "not found"
+        elif decision and role in member.roles:
+            result[4] = "skipped (already whitelisted)"
+            done_rows[str(result[0])] = result[3]
+        else:
+            (approvals if decision else rejections).append((result, member))
+
+    def approve(result, member):
+        async def action():
+            await member.add_roles(role, reason=f"Bulk whitelist by {interaction.user}")
+            done_rows[str(result[0])] = result[3]
+        return action
+
+    report = bulk_progress_reporter(interaction, "Whitelist bulk")
+    last_save = time.monotonic()
+
+    async def on_progress(done: int, total: int):
+        nonlocal last_save
+        await report(done, total)
+        if time.monotonic() - last_save >= BULK_PROGRESS_INTERVAL:
+            last_save = time.monotonic()
+            save_whitelist_ledger(ledger)
+
+    jobs = [(f"roles:{guild.id}", result, approve(result, member)) for result, member in approvals]
+    try:
+        outcomes = await whitelist_queue.run(jobs, on_progress=on_progress)
+        for (result, member), (_, error) in zip(approvals, outcomes):
+            if error:
+                result[4] = f"failed: {error}"
+            else:
+                result[4] = "approved"
+                audit_store.record(guild.id, "whitelist_approved", member, interaction.user, "bulk")
+                log_sink.post(whitelist_approved_embed(member, interaction.user), content=member.mention)
+        for result, member in rejections:
+            result[4] = "rejected"
+            audit_store.record(guild.id, "whitelist_rejected", member, interaction.user, "bulk")
+            done_rows[str(result[0])] = result[3]
+            log_sink.post(whitelist_rejected_embed(member, interaction.user), content=member.mention)
+    finally:
+        save_whitelist_ledger(ledger)
+
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["row", "user", "decision", "member_id", "status"])
+    writer.writerows(results)
+    counts = {}
+    for result in results:
+        status = result[4].split(" (", 1)[0].split(":", 1)[0]
+        counts[status] = counts.get(status, 0) + 1
+    summary = ", ".join(f"{count} {status}" for status, count in sorted(counts.items()))
+    await interaction.edit_original_response(
+        content=f"Processed {len(results)} rows: {summary or 'nothing to do'}.",
+        attachments=[discord.File(io.BytesIO(output.getvalue().encode()), filename="whitelist_results.csv")]
+    )
+
 
 # --- Autocomplete for Whitelist Approved ---
 @whitelist_approved.autocomplete("user")
 async def whitelist_approved_autocomplete(interaction: discord.Interaction, current: str):
-    guild = interaction.guild
-    members = [member for member in guild.members if not member.bot]
-    suggestions = [member for member in members if current.lower() in member.name.lower()]
-    return [app_commands.Choice(name=member.name, value=member.name) for member in suggestions]
+    return member_autocomplete(interaction, current)
 
 # --- Autocomplete for Whitelist Rejected ---
 @whitelist_rejected.autocomplete("user")
 async def whitelist_rejected_autocomplete(interaction: discord.Interaction, current: str):
-    guild = interaction.guild
-    members = [member for member in guild.members if not member.bot]
-    suggestions = [member for member in members if current.lower() in member.name.lower()]
-    return [app_commands.Choice(name=member.name, value=member.name) for member in suggestions]
+    return member_autocomplete(interaction, current)
 
 
 # --- Custom Embed Command ---
 class AnnounceModal(Modal):
-    def __init__(self, channel: discord.TextChannel, color: discord.Color = None, image_url: str = None):
+    def __init__(self, channel_ids, problems=(), color: discord.Color = None, image_url: str = None):
         super().__init__(title="Announcement Form")
-        self.channel = channel
+        self.channel_ids = channel_ids
+        self.problems = list(problems)
         self.color = color or discord.Color.blue()
         self.image_url = image_url
 
@@ -332,206 +3245,421 @@ class AnnounceModal(Modal):
         self.add_item(self.mention_input)
 
     async def on_submit(self, interaction: discord.Interaction):
-        try:
-            title = self.title_input.value
-            description = self.description_input.value
-            mention_everyone = self.mention_input.value.lower() in ["yes", "y"]
-
-            embed = discord.Embed(
-                title=title,
-                description=description,
-                color=self.color
-            )
-
-            if self.image_url:
-                embed.set_image(url=self.image_url)
-
-            message_content = "@everyone" if mention_everyone else None
-            await self.channel.send(content=message_content, embed=embed)
-            await interaction.response.send_message("Announcement sent successfully!", ephemeral=True)
-        except Exception as e:
-            await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
+        mention_everyone = self.mention_input.value.lower() in ["yes", "y"]
+        embed = discord.Embed(
+            title=self.title_input.value,
+            description=self.description_input.value,
+            color=self.color
+        )
+        if self.image_url:
+            embed.set_image(url=self.image_url)
+        message_content = "@everyone" if mention_everyone else None
+        await deliver_announcement(interaction, embed, message_content, self.channel_ids, self.problems)
 
 @bot.tree.command(name="embed", description="Create and send an embed.")
 @role_required()
-@app_commands.describe(channel="Channel to send the embed to.", color="Optional embed color in hex (e.g., #ff5733).", image_url="Optional image URL for the embed.")
-async def announce(interaction: discord.Interaction, channel: discord.TextChannel, color: str = None, image_url: str = None):
-    try:
-        parsed_color = None
-        if color:
-            try:
-                parsed_color = discord.Color(int(color.strip('#'), 16))
-            except ValueError:
-                await interaction.response.send_message("Invalid color format. Use hex format, e.g., #ff5733.", ephemeral=True)
-                return
-
-        modal = AnnounceModal(channel=channel, color=parsed_color, image_url=image_url)
-        await interaction.response.send_modal(modal)
-
-    except Exception as e:
-        await interaction.response.send_message(f"An error occurred: {e}", ephemeral=True)
+@app_commands.describe(
+    channel="Channel to send the embed to.",
+    color="Optional embed color in hex (e.g., #ff5733).",
+    image_url="Optional image URL for the embed.",
+    channels="Also send to these channels (mentions or IDs).",
+    group="Also send to every channel of this configured group."
+)
+@app_commands.autocomplete(group=channel_group_autocomplete)
+async def embed_command(interaction: discord.Interaction, channel: discord.TextChannel, color: str = None, image_url: str = None, channels: str = None, group: str = None):
+    parsed_color = None
+    if color:
+        try:
+            parsed_color = discord.Color(parse_hex_color(color))
+        except ValueError:
+            await interaction.response.send_message("Invalid color format. Use hex format, e.g., #ff5733.", ephemeral=True)
+            return
+    channel_ids, problems = collect_fanout_channels(interaction, channels, group)
+    channel_ids = list(dict.fromkeys([channel.id, *channel_ids]))
+    modal = AnnounceModal(channel_ids, problems, color=parsed_color, image_url=image_url)
+    await interaction.response.send_modal(modal)
 
 
         
         
         
-# --- Command for faqs ---        
-@bot.tree.command(name="faq", description="Provides FAQs based on categories")
-async def faq_command(interaction: discord.Interaction):
-    
-    options = [
-        discord.SelectOption(label="Discord", description="FAQs about Discord"),
-        discord.SelectOption(label="In-game", description="FAQs about the game")
-    ]
+# --- Command for faqs ---
+FAQ_PAGE_SIZE = 25  # Discord allows at most 25 options per select menu
 
-    select = Select(
-        placeholder="Choose a category...",
-        options=options
-    )
 
-    async def select_callback(select_interaction: discord.Interaction):
-        if select.values[0] == "In-game":
-            
-            in_game_options = [
-                discord.SelectOption(label="faq1", description="desp"),
-                discord.SelectOption(label="faq2", description="desp"),
-                discord.SelectOption(label="faq3", description="desp"),
-                discord.SelectOption(label="faq4", description="desp"),
-                discord.SelectOption(label="faq5", description="desp"),
-                discord.SelectOption(label="faq6", description="desp"),
-                discord.SelectOption(label="faq7", description="desp"),
-                discord.SelectOption(label="faq8", description="desp"),
-                discord.SelectOption(label="faq9", description="desp"),
-                discord.SelectOption(label="faq10", description="desp"),
-                discord.SelectOption(label="faq11", description="desp"),
-                discord.SelectOption(label="faq12", description="desp"),
-                discord.SelectOption(label="faq13", description="desp"),
-                discord.SelectOption(label="faq14", description="desp"),
-                discord.SelectOption(label="faq15", description="desp"),
-                discord.SelectOption(label="faq16", description="desp"),
-                discord.SelectOption(label="faq17", description="desp"),
-                discord.SelectOption(label="faq18", description="desp"),
-                discord.SelectOption(label="faq19", description="desp"),
-                discord.SelectOption(label="faq20", description="desp")
-            ]
+class FAQCategorySelect(Select):
+    def __init__(self, categories, page):
+        options = [
+            discord.SelectOption(label=category["label"], value=category["id"], description=category.get("description"))
+            for category in categories
+        ]
+        super().__init__(placeholder="Choose a category...", options=options, custom_id=f"faq:category:{page}")
 
-            unique_links = {
-                "faq1": "https://example.com/",
-                "faq2": "https://example.com/",
-                "faq3": "https://example.com/",
-                "faq4": "https://example.com/",
-                "faq5": "https://example.com/",
-                "faq6": "https://example.com/",
-                "faq7": "https://example.com/",
-                "faq8": "https://example.com/",
-                "faq9": "https://example.com/",
-                "faq10": "https://example.com/",
-                "faq11": "https://example.com/",
-                "faq12": "https://example.com/",
-                "faq13": "https://example.com/",
-                "faq14": "https://example.com/",
-                "faq15": "https://example.com/",
-                "faq16": "https://example.com/",
-                "faq17": "https://example.com/",
-                "faq18": "https://example.com/",
-                "faq19": "https://example.com/",
-                "faq20": "https://example.com/"
-            }
-
-            in_game_select = Select(
-                placeholder="Choose an in-game FAQ...",
-                options=in_game_options
-            )
+    async def callback(self, interaction: discord.Interaction):
+        view = faq_catalogue.entry_view(self.values[0], 0)
+        if view is None:
+            await interaction.response.send_message("This FAQ category is no longer available.", ephemeral=True)
+            return
+        await interaction.response.send_message(content=view.content, view=view, ephemeral=True)
 
-            async def in_game_select_callback(in_game_interaction: discord.Interaction):
-                selected_option = in_game_select.values[0]
-                link = unique_links.get(selected_option, "https://example.com/default")
-                embed = discord.Embed(
-                    title="Tutorial",
-                    description=f"Click here to watch the tutorial for {selected_option}",
-                    color=discord.Color.blue()
-                )
-                embed.add_field(name="Link", value=f"[Click here]({link})")
-                await in_game_interaction.response.send_message(embed=embed, ephemeral=True)
 
-            in_game_select.callback = in_game_select_callback
-            in_game_view = View()
-            in_game_view.add_item(in_game_select)
+class FAQEntrySelect(Select):
+    def __init__(self, category, entries, page):
+        options = [
+            discord.SelectOption(label=entry["label"], value=entry["id"], description=entry.get("description"))
+            for entry in entries
+        ]
+        super().__init__(
+            placeholder=category.get("placeholder", "Choose a FAQ..."),
+            options=options,
+            custom_id=f"faq:entries:{category['id']}:{page}",
+        )
+        self.category_id = category["id"]
 
-            await select_interaction.response.send_message(
-                content="Please select an in-game FAQ:",
-                view=in_game_view,
-                ephemeral=True
-            )
+    async def callback(self, interaction: discord.Interaction):
+        embed = faq_catalogue.answers.get((self.category_id, self.values[0]))
+        if embed is None:
+            await interaction.response.send_message("This FAQ is no longer available.", ephemeral=True)
+            return
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+class FAQPageButton(discord.ui.Button):
+    """Previous/next button of a paged select; a category id of None pages through the category list."""
+
+    def __init__(self, category_id, page, target_page, label, disabled):
+        super().__init__(
+            label=label,
+            style=discord.ButtonStyle.secondary,
+            custom_id=f"faq:page:{category_id or ''}:{page}:{target_page}",
+            disabled=disabled,
+        )
+        self.category_id = category_id
+        self.target_page = target_page
+
+    async def callback(self, interaction: discord.Interaction):
+        if self.category_id is None:
+            view = faq_catalogue.category_view(self.target_page)
         else:
-            
-            discord_options = [
-                discord.SelectOption(label="faq1", description="desp"),
-                discord.SelectOption(label="faq2", description="desp"),
-                discord.SelectOption(label="faq3", description="desp"),
-                discord.SelectOption(label="faq4", description="desp"),
-                discord.SelectOption(label="faq5", description="desp")
-            ]
+            view = faq_catalogue.entry_view(self.category_id, self.target_page)
+        if view is None:
+            await interaction.response.send_message("This FAQ page is no longer available.", ephemeral=True)
+            return
+        await interaction.response.edit_message(content=view.content, view=view)
 
-            discord_links = {
-                "faq1": "https://example.com/",
-                "faq2": "https://example.com/",
-                "faq3": "https://example.com/",
-                "faq4": "https://example.com/",
-                "faq5": "https://example.com/"
-            }
-
-            discord_select = Select(
-                placeholder="Choose a Discord FAQ...",
-                options=discord_options
-            )
 
-            async def discord_select_callback(discord_interaction: discord.Interaction):
-                selected_option = discord_select.values[0]
-                link = discord_links.get(selected_option, "https://example.com/default")
+class FAQCatalogue:
+    """FAQ categories loaded from the FAQ file, paged once, with their answer embeds built once.
+
+    Every reply gets a fresh view: discord.py gives a view sent in an ephemeral reply a
+    15-minute timeout, which would stop a shared view for good. The copies from views()
+    are only registered so the custom ids keep working after a restart.
+    """
+
+    def __init__(self, data):
+        self.categories = data["categories"]
+        self.answers = {}  # (category id, entry id) -> Embed
+        self.entry_pages = {}  # (category id, page) -> (category, entries on the page, page count)
+        # Ids end up in select values and custom ids, where a duplicate would shadow another item
+        duplicate = _first_duplicate(category["id"] for category in self.categories)
+        if duplicate is not None:
+            raise ValueError(f"duplicate FAQ category id {duplicate!r}")
+        for category in self.categories:
+            duplicate = _first_duplicate(entry["id"] for entry in category["entries"])
+            if duplicate is not None:
+                raise ValueError(f"duplicate FAQ entry id {duplicate!r} in category {category['id']!r}")
+
+        self.category_pages = [
+            self.categories[start:start + FAQ_PAGE_SIZE] for start in range(0, max(1, len(self.categories)), FAQ_PAGE_SIZE)
+        ]
+
+        for category in self.categories:
+            color = discord.Color(int(category.get("color", "#3498db").lstrip("#"), 16))
+            for entry in category["entries"]:
                 embed = discord.Embed(
                     title="Tutorial",
-                    description=f"Click here to watch the tutorial for {selected_option}",
-                    color=discord.Color.green()
+                    description=f"Click here to watch the tutorial for {entry['label']}",
+                    color=color
                 )
-                embed.add_field(name="Link", value=f"[Click here]({link})")
-                await discord_interaction.response.send_message(embed=embed, ephemeral=True)
+                embed.add_field(name="Link", value=f"[Click here]({entry.get('link', 'https://example.com/default')})")
+                self.answers[(category["id"], entry["id"])] = embed
 
-            discord_select.callback = discord_select_callback
-            discord_view = View()
-            discord_view.add_item(discord_select)
+            entries = category["entries"]
+            pages = max(1, math.ceil(len(entries) / FAQ_PAGE_SIZE))
+            for page in range(pages):
+                self.entry_pages[(category["id"], page)] = (category, entries[page * FAQ_PAGE_SIZE:(page + 1) * FAQ_PAGE_SIZE], pages)
+
+    def category_view(self, page: int):
+        if not 0 <= page < len(self.category_pages):
+            return None
+        view = View(timeout=None)
+        view.add_item(FAQCategorySelect(self.category_pages[page], page))
+        view.content = "Choose a category for FAQs:"
+        add_faq_page_buttons(view, None, page, len(self.category_pages))
+        return view
+
+    def entry_view(self, category_id: str, page: int):
+        if (category_id, page) not in self.entry_pages:
+            return None
+        category, entries, pages = self.entry_pages[(category_id, page)]
+        view = View(timeout=None)
+        view.add_item(FAQEntrySelect(category, entries, page))
+        view.content = category.get("prompt", f"Please select a {category['label']} FAQ:")
+        add_faq_page_buttons(view, category_id, page, pages)
+        return view
+
+    def views(self):
+        """Views to register for custom id dispatch; these are never sent themselves."""
+        return [
+            *(self.category_view(page) for page in range(len(self.category_pages))),
+            *(self.entry_view(category_id, page) for category_id, page in self.entry_pages),
+        ]
+
+
+def add_faq_page_buttons(view: View, category_id, page: int, pages: int):
+    if pages > 1:
+        view.content += f" (page {page + 1}/{pages})"
+        view.add_item(FAQPageButton(category_id, page, page - 1, "◀ Previous", page == 0))
+        view.add_item(FAQPageButton(category_id, page, page + 1, "Next ▶", page == pages - 1))
+
+
+def _first_duplicate(ids):
+    seen = set()
+    for item_id in ids:
+        if item_id in seen:
+            return item_id
+        seen.add(item_id)
+    return None
+
+
+faq_catalogue = None
+
+
+def read_faq_catalogue(path: str) -> FAQCatalogue:
+    with open(path, "r", encoding="utf-8") as f:
+        return FAQCatalogue(json.load(f))
 
-            await select_interaction.response.send_message(
-                content="Please select a Discord FAQ:",
-                view=discord_view,
-                ephemeral=True
-            )
 
-    select.callback = select_callback
-    view = View()
-    view.add_item(select)
+def install_faq_catalogue(catalogue: FAQCatalogue):
+    global faq_catalogue
+    for view in catalogue.views():
+        bot.add_view(view)
+    faq_catalogue = catalogue
 
+
+def load_faq_catalogue():
+    """Build the catalogue from the FAQ file and register its views; the old catalogue keeps serving until this succeeds."""
+    catalogue = read_faq_catalogue(config.faq_file)
+    install_faq_catalogue(catalogue)
+    return catalogue
+
+
+@bot.tree.command(name="faq", description="Provides FAQs based on categories")
+async def faq_command(interaction: discord.Interaction):
+    if faq_catalogue is None:
+        await interaction.response.send_message("FAQs are not available right now.", ephemeral=True)
+        return
+    view = faq_catalogue.category_view(0)
+    await interaction.response.send_message(content=view.content, view=view, ephemeral=True)
+
+
+# Slash command: Reload FAQs
+@bot.tree.command(name="faq_reload", description="Reload the FAQ catalogue from its data file.")
+@role_required()
+async def faq_reload(interaction: discord.Interaction):
+    try:
+        catalogue = load_faq_catalogue()
+    except (OSError, ValueError, KeyError) as e:
+        await interaction.response.send_message(f"Could not reload FAQs, keeping the current ones: {e}", ephemeral=True)
+        return
     await interaction.response.send_message(
-        content="Choose a category for FAQs:",
-        view=view,
+        f"Reloaded {len(catalogue.categories)} FAQ categories with {len(catalogue.answers)} answers.",
         ephemeral=True
     )
 
     
     
+# --- Command tree sync ---
+COMMAND_HASH_FILE = "command_tree_hash.json"
+
+
+def command_sync_guild():
+    return discord.Object(id=config.sync_guild_id) if config.sync_guild_id else None
+
+
+def command_tree_fingerprint(guild=None):
+    payload = []
+    for command in sorted(bot.tree.get_commands(guild=guild), key=lambda c: (type(c).__name__, c.name)):
+        payload.append({
+            "schema": command.to_dict(bot.tree),
+            "checks": [check.__qualname__ for check in getattr(command, "checks", [])],
+        })
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def load_command_hashes():
+    try:
+        with open(COMMAND_HASH_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+async def sync_command_tree(force: bool = False):
+    """Sync the command tree if its fingerprint changed. Returns the synced commands, or None when skipped."""
+    guild = command_sync_guild()
+    if guild:
+        bot.tree.copy_global_to(guild=guild)
+    scope = str(guild.id) if guild else "global"
+    fingerprint = command_tree_fingerprint(guild)
+    hashes = load_command_hashes()
+    if not force and hashes.get(scope) == fingerprint:
+        return None
+    synced = await bot.tree.sync(guild=guild)
+    hashes[scope] = fingerprint
+    with open(COMMAND_HASH_FILE, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, indent=2)
+    return synced
+
+
+# Slash command: Force command sync
+@bot.tree.command(name="resync", description="Force a sync of the slash command tree.")
+@role_required()
+async def resync(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        synced = await sync_command_tree(force=True)
+        await interaction.followup.send(f"Synced {len(synced)} commands.", ephemeral=True)
+    except discord.HTTPException as e:
+        await interaction.followup.send(f"Failed to sync commands: {e}", ephemeral=True)
+
+
+# --- Configuration reload ---
+def reload_config():
+    """Re-read the config and rebuild permissions, FAQs and schedules, then swap them in together.
+
+    Raises before anything is swapped if the config or a dependent file is invalid.
+    Returns the changed setting names and those among them that need a restart.
+    """
+    global config, permissions
+    new_config = Config.load()
+    changed = config.changes(new_config)
+    restart = [name for name in changed if not CONFIG_FIELDS[name].reloadable]
+    for name in restart:
+        # Code that reads these later (e.g. member_chunking in on_ready) must keep seeing what the process started with
+        setattr(new_config, name, getattr(config, name))
+    new_permissions = build_permissions(new_config)
+    new_catalogue = read_faq_catalogue(new_config.faq_file)
+    scheduler_running = announcement_scheduler.task is not None and not announcement_scheduler.task.done()
+    jobs = announcement_scheduler.read_jobs() if scheduler_running and os.path.exists(announcement_scheduler.path) else None
+    # No awaits from here on, so no interaction sees a mix of old and new settings
+    config, permissions = new_config, new_permissions
+    install_faq_catalogue(new_catalogue)
+    log_sink.channel_id = config.logging_channel_id
+    if jobs is not None:
+        announcement_scheduler.replace_jobs(jobs)
+    return changed, restart
+
+
+def reload_config_on_signal():
+    try:
+        changed, restart = reload_config()
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[ERROR] Config reload failed, keeping the current settings: {e}")
+        return
+    print(f"[INFO] Config reloaded on SIGHUP, changed: {', '.join(changed) or 'nothing'}.")
+    if restart:
+        print(f"[WARN] Restart to apply: {', '.join(restart)}.")
+
+
+# Slash command: Reload configuration
+@bot.tree.command(name="config_reload", description="Reload settings, permissions, FAQs and schedules without restarting.")
+@role_required()
+async def config_reload(interaction: discord.Interaction):
+    try:
+        changed, restart = reload_config()
+    except (OSError, ValueError, KeyError) as e:
+        await interaction.response.send_message(f"Could not reload the config, keeping the current settings: {e}", ephemeral=True)
+        return
+    if PROCESS_SHARD_IDS is not None and hasattr(signal, "SIGHUP"):
+        # The shard supervisor forwards SIGHUP to every worker process
+        os.kill(os.getppid(), signal.SIGHUP)
+    message = f"Config reloaded. Changed: {', '.join(changed) or 'nothing'}."
+    if restart:
+        message += f"\nThese only take effect after a restart: {', '.join(restart)}."
+    if "sync_guild_id" in changed:
+        message += "\nRun /resync to sync commands to the new guild."
+    await interaction.response.send_message(message, ephemeral=True)
+
+
+@bot.event
+async def setup_hook():
+    startup_profile.mark("login")
+
+
+@bot.listen("on_connect")
+async def profile_gateway_connect():
+    startup_profile.mark("gateway connect")
+
+
 @bot.event
 async def on_ready():
-    await bot.tree.sync()
+    global permissions, background_chunking
+    chunked_at_startup = not LEAN_MEMBER_CACHE and config.member_chunking == "startup"
+    startup_profile.mark("guilds ready and member chunking" if chunked_at_startup else "guilds ready")
     print(f"Logged in as {bot.user}!")
-    print(f"[INFO] Scheduled task started.")
+    if hasattr(signal, "SIGHUP"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, reload_config_on_signal)
     try:
-        synced = await bot.tree.sync()
-        print(f"Synced {len(synced)} commands successfully.")
-    except Exception as e:
-        print(f"Failed to sync commands: {e}")
-    print(f"Logged in as {bot.user}")
-    if not scheduled_task.is_running():
-        scheduled_task.start()
+        permissions = build_permissions(config)
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Could not load permissions from {config.permissions_file}, keeping the current ones: {e}")
+    if faq_catalogue is None:
+        try:
+            load_faq_catalogue()
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[ERROR] Could not load FAQs from {config.faq_file}: {e}")
+    if not LEAN_MEMBER_CACHE and config.member_chunking == "background":
+        if background_chunking is None or background_chunking.done():
+            background_chunking = asyncio.create_task(chunk_guilds_in_background())
+    if IS_PRIMARY_PROCESS:
+        announcement_scheduler.start()
+        if not audit_retention.is_running():
+            audit_retention.start()
+    audit_store.start()
+    await expiry_scheduler.start()
+    load_polls()
+    if not poll_saver.is_running():
+        poll_saver.start()
+    if not metrics_sampler.is_running():
+        metrics_sampler.start()
+    await start_metrics_server()
+    startup_profile.mark("permissions, FAQs and services")
+    # Syncing last keeps it from holding up the services above; commands already registered keep working meanwhile
+    if IS_PRIMARY_PROCESS:
+        try:
+            synced = await sync_command_tree()
+            if synced is None:
+                print("[INFO] Command tree unchanged, skipping sync.")
+            else:
+                print(f"Synced {len(synced)} commands successfully.")
+        except Exception as e:
+            print(f"Failed to sync commands: {e}")
+        startup_profile.mark("command sync")
+    if config.profile_startup and not startup_profile.reported:
+        startup_profile.report()
+    startup_profile.reported = True
 
 
-bot.run("")
+if __name__ == "__main__":
+    startup_profile.mark("command and view setup")
+    if SHARDED and SHARD_PROCESSES > 1 and PROCESS_SHARD_IDS is None:
+        run_shard_processes()
+    else:
+        if not config.token:
+            raise SystemExit(f"[ERROR] No bot token: set MERP_TOKEN or \"token\" in {CONFIG_FILE}.")
+        try:
+            bot.run(config.token)
+        finally:
+            # The writer is a daemon thread, so entries still queued at exit would be dropped
+            audit_store.close()